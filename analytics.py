@@ -0,0 +1,297 @@
+"""Columnar analytics over archived games.
+
+Packs per-game event logs (see CONFIG["event_log"] and tournament.py
+--event-log-dir) into one NumPy archive of flat columns: players, votes,
+night actions, eliminations and per-game outcomes. Every metric is then
+computed with vectorized array operations over all games at once.
+
+    python analytics.py pack game_logs/*.jsonl --out games.npz
+    python analytics.py report games.npz [more.npz ...]
+"""
+import argparse
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from mafia import EventLog, fold_events
+
+ROLES = ("Mafia", "Doctor", "Detective", "Town")
+ACTIONS = ("kill", "save", "investigate")
+CAUSES = ("killed", "executed")
+WINNERS = ("Mafia", "Innocents")
+SKIP = -1  # target column value for a Skip vote
+
+MAFIA, DOCTOR, DETECTIVE, TOWN = range(len(ROLES))
+KILL, SAVE, INVESTIGATE = range(len(ACTIONS))
+
+# Column name -> dtype. Player, game and target columns hold global row indices.
+COLUMNS = {
+    "game_winner": np.int8,        # index into WINNERS, -1 if unfinished
+    "game_days": np.int16,
+    "player_game": np.int32,
+    "player_name": np.str_,
+    "player_role": np.int8,        # index into ROLES
+    "player_model": np.int16,      # index into "models"
+    "vote_game": np.int32,
+    "vote_day": np.int16,
+    "vote_voter": np.int32,
+    "vote_target": np.int32,       # SKIP for a Skip vote
+    "vote_model": np.int16,        # model that answered, which routing can make differ from the voter's
+    "action_game": np.int32,
+    "action_day": np.int16,
+    "action_kind": np.int8,        # index into ACTIONS
+    "action_actor": np.int32,
+    "action_target": np.int32,
+    "action_model": np.int16,      # model that answered
+    "elim_game": np.int32,
+    "elim_day": np.int16,
+    "elim_player": np.int32,
+    "elim_cause": np.int8,         # index into CAUSES
+}
+
+
+def pack(paths: Sequence[str]) -> Dict[str, np.ndarray]:
+    """Folds each event log with mafia.fold_events and flattens the result into columns."""
+    columns = defaultdict(list)
+    models: Dict[str, int] = {}
+    for game, path in enumerate(paths):
+        state = fold_events(EventLog.read(path))
+        seats: Dict[str, int] = {}
+        for name, seat in state["roster"].items():
+            seats[name] = len(columns["player_game"])
+            columns["player_game"].append(game)
+            columns["player_name"].append(name)
+            columns["player_role"].append(ROLES.index(seat["role"]))
+            columns["player_model"].append(models.setdefault(seat["model"], len(models)))
+        for day, voter, target, model in state["votes"]:
+            columns["vote_game"].append(game)
+            columns["vote_day"].append(day)
+            columns["vote_voter"].append(seats[voter])
+            columns["vote_target"].append(seats.get(target, SKIP))
+            columns["vote_model"].append(models.setdefault(model, len(models)))
+        for day, kind, actor, target, model in state["actions"]:
+            columns["action_game"].append(game)
+            columns["action_day"].append(day)
+            columns["action_kind"].append(ACTIONS.index(kind))
+            columns["action_actor"].append(seats[actor])
+            columns["action_target"].append(seats.get(target, SKIP))
+            columns["action_model"].append(models.setdefault(model, len(models)))
+        for elimination in state["eliminations"]:
+            columns["elim_game"].append(game)
+            columns["elim_day"].append(elimination["day"])
+            columns["elim_player"].append(seats[elimination["name"]])
+            columns["elim_cause"].append(CAUSES.index(elimination["cause"]))
+        columns["game_winner"].append(WINNERS.index(state["winner"]) if state["winner"] else -1)
+        columns["game_days"].append(state["day"])
+
+    tables = {name: np.asarray(columns[name], dtype=dtype) for name, dtype in COLUMNS.items()}
+    tables["models"] = np.asarray(list(models), dtype=np.str_)
+    return tables
+
+
+def save(tables: Dict[str, np.ndarray], path: str):
+    np.savez_compressed(path, **tables)
+
+
+def load(paths: Sequence[str]) -> Dict[str, np.ndarray]:
+    """Loads one or more packed archives, shifting game and player indices so they concatenate."""
+    parts = []
+    for path in paths:
+        with np.load(path) as archive:
+            parts.append({name: archive[name] for name in archive.files})
+    if len(parts) == 1:
+        return parts[0]
+
+    models = list(dict.fromkeys(model for part in parts for model in part["models"].tolist()))
+    merged = defaultdict(list)
+    games = players = 0
+    for part in parts:
+        remap = np.asarray([models.index(model) for model in part["models"].tolist()], dtype=np.int16)
+        for name in COLUMNS:
+            column = part[name]
+            if name.endswith("_game"):
+                column = column + games
+            elif name in ("vote_voter", "action_actor", "elim_player"):
+                column = column + players
+            elif name in ("vote_target", "action_target"):
+                column = np.where(column == SKIP, SKIP, column + players)
+            elif name.endswith("_model"):
+                column = remap[column]
+            merged[name].append(column)
+        games += len(part["game_winner"])
+        players += len(part["player_game"])
+    tables = {name: np.concatenate(columns).astype(COLUMNS[name], copy=False) for name, columns in merged.items()}
+    tables["models"] = np.asarray(models, dtype=np.str_)
+    return tables
+
+
+# --- METRICS ---
+
+def _vote_groups(t: Dict[str, np.ndarray]):
+    """Group id of each vote by (game, day); votes are stored in casting order."""
+    key = t["vote_game"].astype(np.int64) * (int(t["game_days"].max(initial=0)) + 2) + t["vote_day"]
+    starts = np.ones(len(key), dtype=bool)
+    starts[1:] = key[1:] != key[:-1]
+    return np.cumsum(starts) - 1, np.flatnonzero(starts)
+
+
+def vote_matrix(t: Dict[str, np.ndarray], game: int, day: int) -> np.ndarray:
+    """Voter x target counts for one game and day; the last column counts Skip votes."""
+    seats = np.flatnonzero(t["player_game"] == game)
+    mask = (t["vote_game"] == game) & (t["vote_day"] == day)
+    voters = t["vote_voter"][mask] - seats[0]
+    targets = np.where(t["vote_target"][mask] == SKIP, len(seats), t["vote_target"][mask] - seats[0])
+    matrix = np.zeros((len(seats), len(seats) + 1), dtype=np.int32)
+    np.add.at(matrix, (voters, targets), 1)
+    return matrix
+
+
+def role_vote_matrix(t: Dict[str, np.ndarray]) -> np.ndarray:
+    """Votes from each role (rows) to each role (columns, then Skip), over every game and day."""
+    targets = t["vote_target"]
+    target_role = np.where(targets == SKIP, len(ROLES), t["player_role"][np.maximum(targets, 0)])
+    matrix = np.zeros((len(ROLES), len(ROLES) + 1), dtype=np.int64)
+    np.add.at(matrix, (t["player_role"][t["vote_voter"]], target_role), 1)
+    return matrix
+
+
+def herding(t: Dict[str, np.ndarray]) -> Dict[str, float]:
+    """Bandwagon and anchoring measures over every day's ballot.
+
+    follow_previous: share of votes matching the vote cast just before.
+    chance: the same share expected if each day's votes were shuffled.
+    anchored_to_first: share of later votes matching the day's first vote.
+    consensus: share of votes that went to the day's most-voted target.
+    """
+    if not len(t["vote_target"]):
+        return {"follow_previous": 0.0, "chance": 0.0, "anchored_to_first": 0.0, "consensus": 0.0}
+    group, starts = _vote_groups(t)
+    target = t["vote_target"]
+
+    same_day = group[1:] == group[:-1]
+    follow = (target[1:] == target[:-1])[same_day].mean() if same_day.any() else 0.0
+
+    pairs, counts = np.unique(np.stack([group, target]), axis=1, return_counts=True)
+    votes_per_day = np.bincount(group)
+    matching_pairs = np.bincount(pairs[0], weights=counts * (counts - 1.0), minlength=len(votes_per_day))
+    possible_pairs = votes_per_day * (votes_per_day - 1.0)
+    adjacent = votes_per_day - 1.0
+    chance = (np.divide(matching_pairs, possible_pairs, out=np.zeros_like(possible_pairs), where=possible_pairs > 0) * adjacent).sum() / max(adjacent.sum(), 1)
+
+    later = np.ones(len(target), dtype=bool)
+    later[starts] = False
+    anchored = (target == target[starts][group])[later].mean() if later.any() else 0.0
+
+    top = np.zeros(len(votes_per_day))
+    np.maximum.at(top, pairs[0], counts)
+    return {
+        "follow_previous": float(follow),
+        "chance": float(chance),
+        "anchored_to_first": float(anchored),
+        "consensus": float(top.sum() / votes_per_day.sum()),
+    }
+
+
+def _rate_by_model(t: Dict[str, np.ndarray], model: np.ndarray, hits: np.ndarray) -> Dict[str, tuple]:
+    """(rate, count) per model index."""
+    size = len(t["models"])
+    totals = np.bincount(model, minlength=size)
+    wins = np.bincount(model, weights=hits, minlength=size)
+    return {t["models"][i]: (wins[i] / totals[i], int(totals[i])) for i in np.flatnonzero(totals)}
+
+
+def bus_rate(t: Dict[str, np.ndarray]) -> Dict[str, tuple]:
+    """How often a Mafia vote lands on a fellow Mafia member, per answering model."""
+    targets = t["vote_target"]
+    mafia_votes = (t["player_role"][t["vote_voter"]] == MAFIA) & (targets != SKIP) & (targets != t["vote_voter"])
+    hits = t["player_role"][targets[mafia_votes]] == MAFIA
+    return _rate_by_model(t, t["vote_model"][mafia_votes], hits)
+
+
+def doctor_save_success(t: Dict[str, np.ndarray]) -> Dict[str, tuple]:
+    """Share of saves on nights with a kill that protected the Mafia's target, per answering model."""
+    night = t["action_game"].astype(np.int64) * (int(t["game_days"].max(initial=0)) + 2) + t["action_day"]
+    kills = t["action_kind"] == KILL
+    saves = t["action_kind"] == SAVE
+    kill_night, kill_target = night[kills], t["action_target"][kills]
+    order = np.argsort(kill_night, kind="stable")
+    kill_night, kill_target = kill_night[order], kill_target[order]
+
+    save_night = night[saves]
+    pos = np.minimum(np.searchsorted(kill_night, save_night), max(len(kill_night) - 1, 0))
+    matched = (kill_night[pos] == save_night) if len(kill_night) else np.zeros(len(save_night), dtype=bool)
+    hits = matched & (kill_target[pos] == t["action_target"][saves]) if len(kill_night) else matched
+    return _rate_by_model(t, t["action_model"][saves][matched], hits[matched])
+
+
+def detective_hit_rate(t: Dict[str, np.ndarray]) -> Dict[str, tuple]:
+    """Share of investigations that found a Mafia member, per answering model."""
+    checks = t["action_kind"] == INVESTIGATE
+    hits = t["player_role"][t["action_target"][checks]] == MAFIA
+    return _rate_by_model(t, t["action_model"][checks], hits)
+
+
+def win_rates(t: Dict[str, np.ndarray]) -> Dict[str, tuple]:
+    """Win rate per seat model over finished games (routed decisions are not separated out)."""
+    winner = t["game_winner"][t["player_game"]]
+    finished = winner >= 0
+    won = (t["player_role"] == MAFIA) == (winner == WINNERS.index("Mafia"))
+    return _rate_by_model(t, t["player_model"][finished], won[finished])
+
+
+def report(t: Dict[str, np.ndarray]) -> str:
+    games = len(t["game_winner"])
+    finished = t["game_winner"] >= 0
+    lines = [
+        f"{games} games ({finished.sum()} finished), {len(t['player_game'])} seats, {len(t['vote_game'])} votes, {len(t['action_game'])} night actions",
+        f"Mafia won {np.mean(t['game_winner'][finished] == 0):.1%} of finished games, average {t['game_days'].mean():.1f} days",
+        "",
+        "Votes by role (rows vote for columns):",
+        f"  {'':<10}" + "".join(f"{name:>10}" for name in (*ROLES, "Skip")),
+    ]
+    for role, row in zip(ROLES, role_vote_matrix(t)):
+        lines.append(f"  {role:<10}" + "".join(f"{count:>10}" for count in row))
+
+    lines += ["", "Herding:"]
+    for name, value in herding(t).items():
+        lines.append(f"  {name:<20}{value:8.1%}")
+
+    for title, rates in (
+        ("Win rate", win_rates(t)),
+        ("Mafia bus rate (votes on a teammate)", bus_rate(t)),
+        ("Doctor save success (nights with a kill)", doctor_save_success(t)),
+        ("Detective hit rate (investigations finding Mafia)", detective_hit_rate(t)),
+    ):
+        lines += ["", f"{title} by model:"]
+        for model, (rate, count) in sorted(rates.items()):
+            lines.append(f"  {model:<30}{rate:8.1%}  (n={count})")
+    return "\n".join(lines)
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Columnar analytics over archived Mafia games.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    pack_parser = commands.add_parser("pack", help="Pack event logs into one columnar .npz archive.")
+    pack_parser.add_argument("logs", nargs="+")
+    pack_parser.add_argument("--out", required=True)
+    report_parser = commands.add_parser("report", help="Print every metric for one or more archives.")
+    report_parser.add_argument("archives", nargs="+")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    if args.command == "pack":
+        tables = pack(args.logs)
+        save(tables, args.out)
+        print(f"📦 Packed {len(args.logs)} games into {args.out} in {time.perf_counter() - started:.2f}s")
+    else:
+        tables = load(args.archives)
+        text = report(tables)
+        print(text)
+        print(f"\n⏱️  Loaded and analysed in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,281 @@
+"""Engine benchmark suite.
+
+Plays headless games end to end against the zero-latency mock backend, so
+everything measured is the engine's own overhead: games per second, prompt
+assembly, history logging (ANSI strip + append), the action retry loop and
+memory growth of the shared and private histories over a game.
+
+    python bench.py                                   # default suite
+    python bench.py --lobby-sizes 11,50 --rounds 1,3 --games 10
+    python bench.py --save bench_baseline.json        # record a baseline
+    python bench.py --compare bench_baseline.json     # fail on regressions
+"""
+import argparse
+import asyncio
+import functools
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+import mafia
+from mafia import CONFIG, GameEngine
+
+# Metrics where a higher value is better; every other metric is a cost.
+HIGHER_IS_BETTER = {"games_per_second", "calls_per_second"}
+# Reported but never gated: a difference of two averages divided by a small
+# retry delta, so run-to-run noise is amplified several times over.
+UNGATED = {"retry_overhead_us"}
+
+
+class Timer:
+    """Accumulates wall time and call count for a wrapped function."""
+    def __init__(self):
+        self.seconds = 0.0
+        self.count = 0
+
+    def wrap(self, fn: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def timed_async(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    self.seconds += time.perf_counter() - started
+                    self.count += 1
+            return timed_async
+
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.seconds += time.perf_counter() - started
+                self.count += 1
+        return timed
+
+    def per_call_us(self) -> float:
+        return self.seconds / self.count * 1e6 if self.count else 0.0
+
+
+def configure(lobby_size: int, rounds: int, invalid_rate: float, discussion: str):
+    """Points CONFIG at the offline backend with no waiting and no files."""
+    CONFIG.update({
+        "backend": "mock",
+        "mock": {**CONFIG["mock"], "latency_seconds": 0.0, "error_rate": 0.0, "invalid_rate": invalid_rate},
+        "retry": {**CONFIG["retry"], "base_delay_seconds": 0},
+        "response_cache": {**CONFIG["response_cache"], "mode": "off"},
+        "event_log": {**CONFIG["event_log"], "enabled": False},
+        "lobby": {**CONFIG["lobby"], "size": None if lobby_size == len(mafia.DEFAULT_ROSTER) else lobby_size},
+        "discussion": {**CONFIG["discussion"], "mode": discussion},
+        "discussion_rounds_per_day": rounds,
+    })
+
+
+def new_engine(seed: int) -> GameEngine:
+    CONFIG["mock"] = {**CONFIG["mock"], "seed": seed}
+    CONFIG["lobby"] = {**CONFIG["lobby"], "seed": seed}
+    return GameEngine(headless=True, seed=seed)
+
+
+def time_games(games: int, base_seed: int) -> Dict[str, Any]:
+    """Plays `games` games with the hot paths wrapped in timers."""
+    timers = {name: Timer() for name in ("prompt_build", "context_fit", "log", "strip_ansi", "action")}
+    calls = days = retries = log_chars = 0
+    started = time.perf_counter()
+    for i in range(games):
+        engine = new_engine(base_seed + i)
+        engine.llm.prompts.build = timers["prompt_build"].wrap(engine.llm.prompts.build)
+        engine.context_budget.fit = timers["context_fit"].wrap(engine.context_budget.fit)
+        engine._write_log = timers["log"].wrap(engine._write_log)
+        engine._strip_ansi = timers["strip_ansi"].wrap(engine._strip_ansi)
+        engine._get_valid_action_response = timers["action"].wrap(engine._get_valid_action_response)
+        engine.start()
+        calls += engine.llm.api_calls
+        days += engine.day_count
+        retries += sum(engine.action_retries.values())
+        log_chars += len(engine.shared_history.render())
+    elapsed = time.perf_counter() - started
+
+    return {
+        "games": games,
+        "seconds": elapsed,
+        "games_per_second": games / elapsed,
+        "calls_per_second": calls / elapsed,
+        "avg_days": days / games,
+        "avg_calls": calls / games,
+        "prompt_build_us": timers["prompt_build"].per_call_us(),
+        "context_fit_us": timers["context_fit"].per_call_us(),
+        "log_us": timers["log"].per_call_us(),
+        "strip_ansi_us": timers["strip_ansi"].per_call_us(),
+        "log_share": timers["log"].seconds / elapsed,
+        "prompt_build_share": timers["prompt_build"].seconds / elapsed,
+        "action_us": timers["action"].per_call_us(),
+        "action_retries_per_game": retries / games,
+        "retries_per_action": retries / timers["action"].count if timers["action"].count else 0.0,
+        "history_chars": log_chars / games,
+    }
+
+
+def measure_memory(seed: int) -> Dict[str, Any]:
+    """Traces allocations through one game, sampling history sizes after every day."""
+    engine = new_engine(seed)
+    samples = []
+    run_day_phase = engine.run_day_phase
+
+    async def sampled_day_phase():
+        await run_day_phase()
+        samples.append({
+            "day": engine.day_count,
+            "traced_bytes": tracemalloc.get_traced_memory()[0],
+            "shared_history_chars": len(engine.shared_history.render()),
+            "private_memory_chars": sum(len(p.private_memory.render()) for p in engine.players),
+        })
+
+    engine.run_day_phase = sampled_day_phase
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        engine.start()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    growth = 0.0
+    if len(samples) > 1:
+        growth = (samples[-1]["traced_bytes"] - samples[0]["traced_bytes"]) / (len(samples) - 1)
+    return {
+        "peak_kib": (peak - baseline) / 1024,
+        "retained_kib": (current - baseline) / 1024,
+        "growth_kib_per_day": growth / 1024,
+        "shared_history_chars": samples[-1]["shared_history_chars"] if samples else 0,
+        "private_memory_chars": samples[-1]["private_memory_chars"] if samples else 0,
+        "per_day": samples,
+    }
+
+
+def best_of(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Keeps each timing metric's best value across repeats, damping scheduler noise."""
+    best = dict(runs[0])
+    for metric in best:
+        values = [run[metric] for run in runs]
+        if metric in HIGHER_IS_BETTER:
+            best[metric] = max(values)
+        elif metric.endswith("_us") or metric in ("seconds", "log_share", "prompt_build_share"):
+            best[metric] = min(values)
+    return best
+
+
+def run_suite(lobby_sizes: List[int], rounds: List[int], games: int, base_seed: int, discussion: str, repeat: int) -> Dict[str, Any]:
+    results = {}
+    for size in lobby_sizes:
+        for round_count in rounds:
+            for invalid_rate in (0.0, 0.2):
+                name = f"lobby={size} rounds={round_count} invalid={invalid_rate}"
+                configure(size, round_count, invalid_rate, discussion)
+                scenario = best_of([time_games(games, base_seed) for _ in range(repeat)])
+                scenario["memory"] = measure_memory(base_seed)
+                results[name] = scenario
+                print(f"  {name:<36} {scenario['games_per_second']:8.2f} games/s  {scenario['prompt_build_us']:8.1f} us/prompt  {scenario['log_us']:6.1f} us/log  {scenario['memory']['peak_kib']:9.0f} KiB peak")
+
+    # The retry loop's overhead: the extra time per action at invalid=0.2 over
+    # invalid=0, divided by the extra retries each action needed.
+    for size in lobby_sizes:
+        for round_count in rounds:
+            clean = results[f"lobby={size} rounds={round_count} invalid=0.0"]
+            noisy = results[f"lobby={size} rounds={round_count} invalid=0.2"]
+            extra_retries = noisy["retries_per_action"] - clean["retries_per_action"]
+            if extra_retries > 0:
+                noisy["retry_overhead_us"] = (noisy["action_us"] - clean["action_us"]) / extra_retries
+    return results
+
+
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"python": sys.version.split()[0], "platform": platform.platform(), "commit": commit, "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def flat_metrics(scenario: Dict[str, Any]) -> Dict[str, float]:
+    metrics = {k: v for k, v in scenario.items() if isinstance(v, (int, float)) and k != "games"}
+    metrics.update({f"memory.{k}": v for k, v in scenario["memory"].items() if isinstance(v, (int, float))})
+    return metrics
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    """Prints a metric-by-metric report and returns the regressions beyond `threshold`."""
+    regressions = []
+    for name, scenario in current["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            print(f"\n  {name}: not in baseline")
+            continue
+        print(f"\n  {name}")
+        old_metrics = flat_metrics(old)
+        for metric, value in flat_metrics(scenario).items():
+            before = old_metrics.get(metric)
+            if not before:
+                continue
+            change = (value - before) / before
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            # Only time and memory costs gate; counts such as avg_days describe the run.
+            gated = metric not in UNGATED and (metric in HIGHER_IS_BETTER or metric.endswith(("_us", "_kib", "_kib_per_day")))
+            flag = ""
+            if gated and worse > threshold:
+                flag = "  <-- REGRESSION"
+                regressions.append(f"{name}: {metric} {before:.4g} -> {value:.4g} ({change:+.1%})")
+            elif gated and worse < -threshold:
+                flag = "  (improved)"
+            print(f"    {metric:<32}{before:>14.4g}{value:>14.4g}{change:>+9.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Mafia engine against the zero-latency mock backend.")
+    parser.add_argument("--lobby-sizes", default="11,50", help="Comma-separated lobby sizes (11 = the default roster).")
+    parser.add_argument("--rounds", default="2", help="Comma-separated discussion rounds per day, to vary game length.")
+    parser.add_argument("--games", type=int, default=10, help="Games per scenario.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scenario; the best timing of each metric is kept.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--discussion", choices=["all", "sampled", "nominations"], default="all")
+    parser.add_argument("--save", metavar="PATH", help="Write the results as a JSON baseline.")
+    parser.add_argument("--compare", metavar="PATH", help="Compare against a saved baseline and exit 1 on regressions.")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown or growth that counts as a regression.")
+    args = parser.parse_args()
+
+    lobby_sizes = [int(size) for size in args.lobby_sizes.split(",")]
+    rounds = [int(count) for count in args.rounds.split(",")]
+    print(f"⏱️  {args.games} games per scenario (best of {args.repeat}), {args.discussion} discussion")
+    current = {
+        "environment": environment(),
+        "parameters": {"lobby_sizes": lobby_sizes, "rounds": rounds, "games": args.games, "repeat": args.repeat, "seed": args.seed, "discussion": args.discussion},
+        "results": run_suite(lobby_sizes, rounds, args.games, args.seed, args.discussion, args.repeat),
+    }
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"\n💾 Baseline written to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\n📊 Compared with {args.compare} (commit {baseline['environment'].get('commit')}):")
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for line in regressions:
+                print(f"   {line}")
+            sys.exit(1)
+        print(f"\n✅ No regressions beyond {args.threshold:.0%}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,187 @@
-import time
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import heapq
+import itertools
+import json
+import os
 import random
 import re
+import sqlite3
+import time
+import zlib
+from collections import Counter, OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
 from termcolor import colored
 from dataclasses import dataclass, field
-from typing import List, Optional, Union
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Protocol, Sequence, Set, Tuple, Union
 from google import genai 
+from google.genai import errors as genai_errors
+from google.genai import types
+import httpx
 
 # --- CONFIGURATION ---
 CONFIG = {
     # Replace with your actual key
     "api_key": "API_KEY_HERE", 
+    # Optional extra keys; calls are spread across all keys round-robin.
+    "api_keys": [],
     
     # Game Settings
     "discussion_rounds_per_day": 2,
     "mafia_discussion_rounds_per_night": 2,
-    "max_retries": float("inf"),
+    "max_retries": 8,
+    # Seed for the engine's own chance (who kills, who gets to speak). None
+    # picks one per game; it is stored with a response-cache recording so a
+    # replay restores it.
+    "seed": None,
+    # Unusable replies (not a valid target) tolerated per action before the
+    # game stops with an error instead of asking forever.
+    "max_invalid_replies": 10,
+
+    # Backoff is exponential with full jitter, starting at base_delay_seconds
+    # and capped at max_delay_seconds (server retry hints win if longer).
+    # Deadlines of None disable the limit.
+    "retry": {
+        "base_delay_seconds": 1.0,
+        "max_delay_seconds": 60.0,
+        "call_timeout_seconds": 120,
+        "game_deadline_seconds": None,
+    },
+
+    # Per-model request/token budgets per minute (GenAI backend only).
+    # "default" applies to models without their own entry.
+    "rate_limits": {
+        "gemma-3-27b-it": {"rpm": 30, "tpm": 15000},
+        "gemma-3-4b-it": {"rpm": 30, "tpm": 15000},
+    },
+
+    # Model routing per call class (statement, thought, action, mafia_chat).
+    # A routed class goes to its cheap model instead of the player's own;
+    # unrouted classes always use the player's model. A routed call moves
+    # to the player's model after `escalate_after_invalid` unusable action
+    # replies, or when it times out (if escalate_on_timeout). Off by default:
+    # when on, routed decisions are not made by the seat's own model.
+    "routing": {
+        "enabled": False,
+        "routes": {
+            "action": "gemma-3-4b-it",
+        },
+        "escalate_after_invalid": 2,
+        "escalate_on_timeout": True,
+        # USD per million tokens, for cost accounting in telemetry. Fill in
+        # from your provider's price sheet; "default" covers unlisted models.
+        "prices": {
+            "default": {"input": 0.0, "output": 0.0},
+        },
+    },
+
+    # LLM backend: "genai" talks to the Google GenAI API; "mock" is an offline,
+    # seeded provider for load tests (optionally with injected latency/errors
+    # and a rate of unusable action replies to exercise the retry paths).
+    "backend": "genai",
+    "mock": {
+        "seed": 0,
+        "latency_seconds": 0.0,
+        "error_rate": 0.0,
+        "invalid_rate": 0.0,
+    },
+
+    # Response cache keyed on model + full prompt, for replaying seeded games
+    # without API calls. Mode: "off", "record", "replay" or "read_through".
+    "response_cache": {
+        "mode": "off",
+        "path": "mafia_cache.sqlite3",
+        "memory_bytes": 64 * 1024 * 1024,
+    },
+
+    # Action prompts (kill/save/investigate/vote) ask the provider to answer
+    # with one of the candidate names via an enum response schema. Models
+    # that reject schemas fall back to free text automatically.
+    "structured_actions": True,
+    # Extra spellings players may use for each other, e.g. {"Val": "Valentina"}.
+    "name_aliases": {},
+
+    # Context budget: prompts estimated above max_prompt_tokens keep the last
+    # keep_recent_days verbatim and fold older days into shared per-day
+    # summaries; private notes keep pinned facts plus the newest that fit.
+    "context_budget": {
+        "enabled": True,
+        "max_prompt_tokens": 8000,
+        "keep_recent_days": 1,
+        "summary_model": None,  # None = CONFIG["models"]["town"]
+    },
+
+    # Every decision and its consequences are appended to a per-game event
+    # log in this directory. Resume a crashed game with
+    # `python mafia.py --resume <log>`; recorded decisions are replayed
+    # without calling a model and play continues at the first missing one.
+    "event_log": {
+        "enabled": True,
+        "dir": "game_logs",
+    },
+
+    # Stream discussion, Mafia chat and thoughts to the console as they are
+    # generated. Action calls (a single name) are never streamed.
+    "streaming": True,
+
+    # Telemetry: spans and per-call metrics. Paths of None skip the export;
+    # the trace is JSONL (appended), the metrics file Prometheus text format.
+    "telemetry": {
+        "enabled": True,
+        "trace_path": None,
+        "metrics_path": None,
+        "print_summary": True,
+    },
+
+    # Concurrency: how many LLM requests may be in flight at once. Independent
+    # actors (e.g. Doctor and Detective at night) are scheduled together.
+    "max_concurrent_requests": 4,
+
+    # Lobby: with "size" None the DEFAULT_ROSTER is played; otherwise that
+    # many players are dealt with these role ratios (at least one of each)
+    # and names from the pools below (None = FIRST_NAMES / SURNAMES).
+    # For large lobbies, pair this with a scaling discussion mode and
+    # "sealed" voting.
+    "lobby": {
+        "size": None,
+        "mafia_ratio": 0.25,
+        "doctor_ratio": 0.05,
+        "detective_ratio": 0.05,
+        "first_names": None,
+        "surnames": None,
+        "seed": None,
+    },
+
+    # Day discussion: "all" lets every alive player speak each round.
+    # "sampled" gives the floor to a random subset of at most max_speakers
+    # per round. "nominations" first has everyone nominate a suspect in one
+    # parallel round, then the most-nominated players and one accuser each
+    # speak. Outside "all", night Mafia chat is capped at max_speakers too.
+    "discussion": {
+        "mode": "all",
+        "max_speakers": 8,
+        # Draft the next speaker's statement while the current one is still in
+        # flight, against the history without it. The draft is kept unless the
+        # statement that lands names the drafting player, in which case it is
+        # regenerated. Costs the rejected drafts' tokens; drafts never stream.
+        "speculative": False,
+    },
+
+    # Voting: "sequential" reveals each vote as it is cast, and every voter
+    # thinks after seeing the votes before theirs (one call at a time);
+    # "sealed" collects every ballot in parallel against the same history and
+    # reveals them together.
+    "voting_mode": "sequential",
+
+    # Provider-side caching of the stable prompt prefix (rules, role block and
+    # history so far), created once per role and day and reused until the next.
+    "context_caching": {
+        "enabled": True,
+        "ttl_seconds": 3600,
+    },
     
     # Model Assignments 
     "models": {
@@ -45,8 +212,247 @@ ROLE_COLORS = {
     "Town": "white"
 }
 
+# Default 11-player lobby: (name, role). Models come from CONFIG["models"].
+DEFAULT_ROSTER = [
+    ("Madison", "Mafia"),
+    ("Avery", "Mafia"),
+    ("Anna", "Mafia"),
+    ("Maddie", "Doctor"),
+    ("Valentina", "Detective"),
+    ("Amber", "Town"),
+    ("Elena", "Town"),
+    ("Ariana", "Town"),
+    ("Sava", "Town"),
+    ("Summer", "Town"),
+    ("Natalie", "Town"),
+]
+
+# Name pools for generated lobbies (CONFIG["lobby"]). Avoid everyday words
+# ("Will", "Hope") so that names are never matched inside ordinary sentences.
+FIRST_NAMES = [
+    "Aaliyah", "Adrian", "Aiden", "Alejandro", "Amara", "Anya", "Aria", "Arjun", "Astrid", "Beatrix",
+    "Bianca", "Caleb", "Camila", "Cassius", "Chiara", "Dalia", "Damian", "Dante", "Delphine", "Dmitri",
+    "Eamon", "Elias", "Eloise", "Emeka", "Esme", "Ezra", "Farah", "Felix", "Freya", "Gideon",
+    "Greta", "Hana", "Hugo", "Ibrahim", "Ines", "Isaac", "Ivana", "Jasper", "Javier", "Kai",
+    "Keiko", "Kenji", "Lars", "Leila", "Lorenzo", "Lucia", "Magnus", "Malik", "Marisol", "Mateo",
+    "Mila", "Nadia", "Nikolai", "Noor", "Oksana", "Omar", "Orla", "Oscar", "Priya", "Quentin",
+    "Rafael", "Ravi", "Rosalind", "Rowan", "Saoirse", "Sebastian", "Selin", "Soren", "Tariq", "Thea",
+    "Tobias", "Ulla", "Valentin", "Vera", "Wilhelmina", "Xavier", "Yara", "Yusuf", "Zainab", "Zoltan",
+]
+SURNAMES = [
+    "Abara", "Becker", "Castillo", "Dubois", "Eriksen", "Fontaine", "Garcia", "Haddad", "Ivanova", "Jensen",
+    "Kowalski", "Lindqvist", "Moreau", "Nakamura", "Okafor", "Petrov", "Quispe", "Rossi", "Sato", "Tanaka",
+    "Usman", "Varga", "Weber", "Xu", "Yilmaz", "Zhou",
+]
+
+DISCUSS_PROMPT = "Discuss the recent events and who you suspect. Keep it under 2 sentences. YOUR RESPONSE HERE WILL NOT BE A PRIVATE MESSAGE TO OTHER MAFIA. EVERY PLAYER WILL SEE YOUR RESPONSE TO THIS ONE. DO NOT ADD ANY SELF-INCRIMINATING COMMENTS OR THOUGHTS TO YOUR RESPONSE. Detective, reference your notes when deciding who to discuss/accuse for."
+
+NOMINATE_PROMPT = "Nominate the one player you most want the town to discuss today. Output a player name."
+
+VOTE_PROMPT = "Remember that your votes can be seen publicly. Detective, reference your notes when deciding who to vote for. Who do you vote to eliminate? Output player name or 'Skip'."
+
+# When set, GameEngine.log() appends to this buffer instead of writing straight
+# to the console/history. PhaseScheduler uses it to keep concurrent output in
+# serial order.
+_LOG_BUFFER: ContextVar[Optional[list]] = ContextVar("_LOG_BUFFER", default=None)
+
 # --- CLASSES ---
 
+ANSI_ESCAPE = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
+
+# Global ordering for history entries, so entries from different logs can be
+# merged into a single timeline without sorting.
+_ENTRY_SEQ = itertools.count()
+
+
+class GameHistory:
+    """Append-only event log with an incrementally rendered text form.
+
+    Rendering only joins the lines appended since the last render, so building
+    a prompt no longer costs O(total history) per call. The version is simply
+    the number of entries, which makes snapshots cheap to take and to hold.
+    """
+    def __init__(self, lines: Sequence[str] = ()):
+        self._lines: List[str] = []
+        self._seqs: List[int] = []
+        self._pinned = set()
+        self.marks: Dict[Any, int] = {}  # label -> version where it was placed
+        self._text = ""
+        self._ends: List[int] = []  # _ends[i] = length of the text rendering lines[:i+1]
+        for line in lines:
+            self.append(line)
+
+    def append(self, line: str, pinned: bool = False):
+        """Adds a line. Pinned lines survive context-budget trimming."""
+        if pinned:
+            self._pinned.add(len(self._lines))
+        self._lines.append(line)
+        self._seqs.append(next(_ENTRY_SEQ))
+
+    def mark(self, label: Any):
+        self.marks[label] = self.version
+
+    @property
+    def version(self) -> int:
+        return len(self._lines)
+
+    def render(self, version: Optional[int] = None) -> str:
+        """Returns the log joined by newlines, as of `version` if given."""
+        rendered = len(self._ends)
+        if rendered < len(self._lines):
+            end = len(self._text)
+            for line in self._lines[rendered:]:
+                end += len(line) + 1 if self._ends else len(line)
+                self._ends.append(end)
+            pending = "\n".join(self._lines[rendered:])
+            self._text = f"{self._text}\n{pending}" if rendered else pending
+        if version is None or version >= len(self._lines):
+            return self._text
+        return self._text[:self._ends[version - 1]] if version else ""
+
+    def render_range(self, start: int, end: Optional[int] = None) -> str:
+        """Returns lines[start:end] joined by newlines, sliced from the rendered text."""
+        text = self.render(end)
+        return text[self._ends[start - 1] + 1:] if start else text
+
+    def snapshot(self) -> "HistorySnapshot":
+        return HistorySnapshot(self, self.version)
+
+    def tail(self, count: int) -> List[str]:
+        return self._lines[-count:] if count else []
+
+    def entries_since(self, version: int):
+        """Yields (seq, line, pinned) for entries appended after `version`."""
+        for i in range(version, len(self._lines)):
+            yield self._seqs[i], self._lines[i], i in self._pinned
+
+    def entries(self):
+        """Yields (line, pinned) for every entry."""
+        for i, line in enumerate(self._lines):
+            yield line, i in self._pinned
+
+    def __iter__(self):
+        return iter(self._lines)
+
+    def __len__(self):
+        return len(self._lines)
+
+    def __getitem__(self, index):
+        return self._lines[index]
+
+    def __bool__(self):
+        return bool(self._lines)
+
+
+@dataclass(frozen=True)
+class HistorySnapshot:
+    """A fixed point in a GameHistory; holding one costs nothing."""
+    history: GameHistory
+    version: int
+
+    def render(self) -> str:
+        return self.history.render(self.version)
+
+
+class HistoryView:
+    """One viewer's merged, read-only timeline over several logs.
+
+    Used for private memory: a player's own notes plus any channels they can
+    see (e.g. Mafia chat). Entries are referenced, not copied, and the view
+    renders incrementally just like GameHistory.
+    """
+    def __init__(self, sources: Sequence[GameHistory]):
+        self._sources = list(sources)
+        self._cursors = [0] * len(self._sources)
+        self._merged = GameHistory()
+
+    def add_source(self, source: GameHistory):
+        self._sources.append(source)
+        self._cursors.append(0)
+
+    def _catch_up(self):
+        new = []
+        for i, source in enumerate(self._sources):
+            if self._cursors[i] < source.version:
+                new.append(source.entries_since(self._cursors[i]))
+                self._cursors[i] = source.version
+        # Sequence numbers only ever grow, so new entries always sort after
+        # everything already merged.
+        for _, line, pinned in heapq.merge(*new):
+            self._merged.append(line, pinned)
+
+    def render(self) -> str:
+        self._catch_up()
+        return self._merged.render()
+
+    def entries(self):
+        self._catch_up()
+        return self._merged.entries()
+
+    def __len__(self):
+        self._catch_up()
+        return len(self._merged)
+
+    def __bool__(self):
+        return len(self) > 0
+
+
+class NameIndex:
+    """Precompiled lookup from free-text action replies to canonical names.
+
+    Tries, in order: an exact match, a case-insensitive match, a configured
+    alias, and finally a bounded whole-word scan of the reply's opening
+    characters. Whole-word matching means "Maddie" never resolves to
+    "Madison" (or vice versa), and a scan that finds several different names
+    is treated as invalid rather than guessing by list order.
+    """
+    WORD = re.compile(r"\w+")
+    FALLBACK_CHARS = 200
+
+    def __init__(self, names: Sequence[str], aliases: Optional[Dict[str, str]] = None):
+        self._exact = {name: name for name in names}
+        self._folded = {name.casefold(): name for name in names}
+        for alias, name in (aliases or {}).items():
+            if name in self._exact:
+                self._folded.setdefault(alias.casefold(), name)
+        self._max_words = max((len(key.split()) for key in self._folded), default=1)
+
+    def lookup(self, text: str) -> Optional[str]:
+        """Exact, case-insensitive or alias match of the whole (trimmed) reply."""
+        cleaned = text.strip().strip("*\"'`[]()").rstrip(".!").strip()
+        if cleaned in self._exact:
+            return cleaned
+        return self._folded.get(cleaned.casefold())
+
+    def resolve(self, text: str, candidates: Sequence[str]) -> Optional[str]:
+        """Maps a reply onto exactly one of `candidates`, or None."""
+        if not isinstance(candidates, (set, frozenset, dict)):
+            candidates = set(candidates)
+        name = self.lookup(text)
+        if name is not None:
+            return name if name in candidates else None
+
+        words = self.WORD.findall(text[:self.FALLBACK_CHARS].casefold())
+        found = []
+        for size in range(1, self._max_words + 1):
+            for start in range(len(words) - size + 1):
+                name = self._folded.get(" ".join(words[start:start + size]))
+                if name in candidates and name not in found:
+                    found.append(name)
+        return found[0] if len(found) == 1 else None
+
+    def mentions(self, text: str) -> Set[str]:
+        """Every name that appears, as whole words or an alias, anywhere in `text`."""
+        words = self.WORD.findall(text.casefold())
+        found = set()
+        for size in range(1, self._max_words + 1):
+            for start in range(len(words) - size + 1):
+                name = self._folded.get(" ".join(words[start:start + size]))
+                if name is not None:
+                    found.add(name)
+        return found
+
+
 @dataclass
 class Player:
     name: str
@@ -55,7 +461,18 @@ class Player:
     is_alive: bool = True
     is_protected: bool = False
     last_protected_target: str = None 
-    private_memory: List[str] = field(default_factory=list)
+    private_memory: GameHistory = field(default_factory=GameHistory)
+    _memory_view: Optional[HistoryView] = field(default=None, init=False, repr=False)
+
+    @property
+    def memory(self) -> HistoryView:
+        """Everything this player privately knows: own notes plus subscribed channels."""
+        if self._memory_view is None:
+            self._memory_view = HistoryView([self.private_memory])
+        return self._memory_view
+
+    def subscribe(self, channel: GameHistory):
+        self.memory.add_source(channel)
 
     @property
     def colored_name(self) -> str:
@@ -67,19 +484,152 @@ class Player:
         return f"{self.name} ({self.role})"
 
 
-class LLMInterface:
-    """Handles communication with the Google GenAI API."""
-    def __init__(self, api_key):
-        try:
-            self.client = genai.Client(api_key=api_key)
-        except Exception as e:
-            print(f"❌ Error initializing GenAI Client: {e}")
-            self.client = None
-
-    def generate(self, player: Player, context: str, instruction: str, distinct_action: bool = False, all_players: List[Player] = None) -> str:
-        if not self.client:
-            return "Error: Client not initialized."
-        
+class Roster:
+    """The lobby, indexed for the questions every phase asks.
+
+    Keeps a name map, the alive players in seat order and alive counts per
+    role. Eliminations go through eliminate() so the indexes stay in step,
+    which makes win checks O(1) and alive lists O(alive) at any lobby size.
+    """
+    def __init__(self, players: Sequence[Player]):
+        self.players = list(players)
+        self.by_name = {p.name: p for p in self.players}
+        self._alive: Dict[str, Player] = {p.name: p for p in self.players if p.is_alive}
+        self._alive_list: Optional[List[Player]] = None
+        self.alive_counts: Counter = Counter(p.role for p in self._alive.values())
+
+    def __len__(self) -> int:
+        return len(self._alive)
+
+    def alive(self) -> List[Player]:
+        """Alive players in seat order (cached until the next elimination)."""
+        if self._alive_list is None:
+            self._alive_list = list(self._alive.values())
+        return self._alive_list
+
+    def alive_names(self) -> List[str]:
+        return list(self._alive)
+
+    def alive_with_role(self, role: str) -> List[Player]:
+        if not self.alive_counts[role]:
+            return []
+        return [p for p in self.alive() if p.role == role]
+
+    def eliminate(self, player: Player):
+        if self._alive.pop(player.name, None) is not None:
+            player.is_alive = False
+            self.alive_counts[player.role] -= 1
+            self._alive_list = None
+
+    def winner(self) -> Optional[str]:
+        mafia = self.alive_counts["Mafia"]
+        if not mafia:
+            return "Innocents"
+        if mafia >= len(self._alive) - mafia:
+            return "Mafia"
+        return None
+
+
+def generate_roster(size: int, settings: Dict[str, Any], rng: random.Random) -> List[Tuple[str, str]]:
+    """Deals a lobby of `size` (name, role) seats.
+
+    Roles follow the configured ratios, with at least one Mafia, Doctor and
+    Detective. Names are single first names while the pool lasts, then
+    "First Last" pairs, so every name is unique.
+    """
+    first_names = settings["first_names"] or FIRST_NAMES
+    if size <= len(first_names):
+        names = rng.sample(first_names, size)
+    else:
+        surnames = settings["surnames"] or SURNAMES
+        if size > len(first_names) * len(surnames):
+            raise ValueError(f"Name pools only cover {len(first_names) * len(surnames)} players, not {size}")
+        names = [f"{first} {last}" for first, last in rng.sample(list(itertools.product(first_names, surnames)), size)]
+
+    counts = {role: max(1, round(size * settings[f"{role.lower()}_ratio"])) for role in ("Mafia", "Doctor", "Detective")}
+    if sum(counts.values()) >= size or counts["Mafia"] * 2 >= size:
+        raise ValueError(f"A lobby of {size} is too small for the configured role ratios")
+    roles = [role for role, count in counts.items() for _ in range(count)]
+    roles += ["Town"] * (size - len(roles))
+    rng.shuffle(roles)
+    return list(zip(names, roles))
+
+
+ROLE_STRATEGY = {
+    "Mafia": (
+        "- Be deceptive. Blend in with the Town by acting concerned about the deaths.\n"
+        "- Coordinate subtly. If your teammate is under fire, decide whether to defend them or 'bus' them (vote them out) to look innocent.\n"
+        "- Avoid repeating the exact phrasing of your fellow Mafia members."
+    ),
+    "Detective": (
+        "- You have the most power. If you find a Mafia member, you must convince the town to vote them out.\n"
+        "- You can choose to 'claim' your role if necessary, but remember the Mafia will target you at night if you do.\n"
+        "- Use your investigation results as 'strong hunches' or 'certainty' to lead the Town."
+    ),
+    "Doctor": (
+        "- Stay alive. You are the only thing keeping the power roles (Detective) safe.\n"
+        "- Pay attention to who is leading the discussion; they are likely the Detective or a target for the Mafia."
+    ),
+    "Town": (
+        "- Look for contradictions and patterns. Who voted for the person who turned out to be an Innocent?\n"
+        "- If someone is making a very specific accusation, consider if they might be the Detective before calling them 'suspicious'.\n"
+        "- Do not be passive. The Mafia wins if you don't find them."
+    ),
+}
+
+
+@dataclass
+class Prompt:
+    """A prompt split into its cacheable prefix and the parts that change per call."""
+    prefix: str   # static rules + role block; identical for every call of a role
+    history: str  # append-only event history
+    tail: str     # volatile state + instruction
+
+    @property
+    def text(self) -> str:
+        return f"{self.prefix}{self.history}{self.tail}"
+
+
+class PromptBuilder:
+    """Assembles prompts from the most stable content to the most volatile.
+
+    Static rules come first, then the per-role block, then the append-only
+    history and finally the per-call state and instruction. Consecutive calls
+    for the same role therefore share the longest possible prefix, which is
+    what both implicit and explicit provider-side caching key on.
+    """
+    def __init__(self):
+        self._prefixes: Dict[str, str] = {}
+
+    def role_prefix(self, role: str) -> str:
+        if role not in self._prefixes:
+            goal = 'Eliminate all Innocents' if role == 'Mafia' else 'Eliminate all Mafia members'
+            self._prefixes[role] = (
+                f"### RULES\n"
+                f"{CONFIG['rules']}\n\n"
+                f"### STRATEGIC MANDATE\n"
+                f"- **Linguistic Diversity:** Do NOT parrot or mimic the phrases used by other players. If others are saying 'this is concerning,' use different language like 'I'm looking at the facts' or 'Something doesn't add up about X'.\n"
+                f"- **Critical Thinking:** Don't just vote because someone is 'quiet' or 'loud.' Look at their voting history.\n\n"
+                f"### ROLE: {role.upper()}\n"
+                f"Your winning condition: {goal}.\n"
+                f"{ROLE_STRATEGY.get(role, ROLE_STRATEGY['Town'])}\n\n"
+                f"### HISTORY OF EVENTS\n"
+            )
+        return self._prefixes[role]
+
+    ACTION_NOTE = "\n🔴 IMPORTANT: Your response must be EXACTLY just the name of the target player. Do not write sentences."
+    NOTES_HEADER = "\n🧠 YOUR INTERNAL MONOLOGUE & NOTES:\n"
+
+    def build(self, player: Player, context: str, instruction: str, distinct_action: bool = False, all_players: List[Player] = None, memory: Optional[str] = None) -> Prompt:
+        tail = f"{self.state_block(player, all_players)}{self._get_private_context(player, memory)}"
+        if distinct_action:
+            tail += self.ACTION_NOTE
+
+        tail += f"\n\nINSTRUCTION: {instruction}"
+        return Prompt(self.role_prefix(player.role), context, tail)
+
+    def state_block(self, player: Player, all_players: List[Player] = None) -> str:
+        """The current game state for `player`, without their notes or the instruction."""
         # --- FIX 1: Clean list of alive players ---
         if all_players:
             others_list = [
@@ -99,155 +649,1458 @@ class LLMInterface:
             ]
             mafia_info = f"Your fellow Mafia members are: {', '.join(teammates)}"
 
-# --- IN THE LLMInterface.generate METHOD ---
-
-# 1. Define Role-Specific Strategic Advice
-        role_strategy = ""
-        if player.role == "Mafia":
-            role_strategy = (
-                "- Be deceptive. Blend in with the Town by acting concerned about the deaths.\n"
-                "- Coordinate subtly. If your teammate is under fire, decide whether to defend them or 'bus' them (vote them out) to look innocent.\n"
-                "- Avoid repeating the exact phrasing of your fellow Mafia members."
-            )
-        elif player.role == "Detective":
-            role_strategy = (
-                "- You have the most power. If you find a Mafia member, you must convince the town to vote them out.\n"
-                "- You can choose to 'claim' your role if necessary, but remember the Mafia will target you at night if you do.\n"
-                "- Use your investigation results as 'strong hunches' or 'certainty' to lead the Town."
-            )
-        elif player.role == "Doctor":
-            role_strategy = (
-                "- Stay alive. You are the only thing keeping the power roles (Detective) safe.\n"
-                "- Pay attention to who is leading the discussion; they are likely the Detective or a target for the Mafia."
-            )
-        else: # Town
-            role_strategy = (
-                "- Look for contradictions and patterns. Who voted for the person who turned out to be an Innocent?\n"
-                "- If someone is making a very specific accusation, consider if they might be the Detective before calling them 'suspicious'.\n"
-                "- Do not be passive. The Mafia wins if you don't find them."
-            )
-
-        # 2. Construct the New System Prompt
-        system_prompt = (
-            f"### ROLE IDENTITY\n"
+        return (
+            f"\n\n### CURRENT GAME STATE\n"
             f"You are {player.name}, and your secret role is {player.role.upper()}.\n"
-            f"Your winning condition: {'Eliminate all Innocents' if player.role == 'Mafia' else 'Eliminate all Mafia members'}.\n\n"
-            
-            f"### STRATEGIC MANDATE\n"
-            f"{role_strategy}\n"
             f"- **Survival Instinct:** CRITICAL: You are {player.name}. You are currently alive. Do not, under any circumstances, vote to eliminate yourself. If you think you should vote for {player.name}, you are confused -- you are {player.name}!\n"
-            f"- **Linguistic Diversity:** Do NOT parrot or mimic the phrases used by other players. If others are saying 'this is concerning,' use different language like 'I'm looking at the facts' or 'Something doesn't add up about X'.\n"
-            f"- **Critical Thinking:** Don't just vote because someone is 'quiet' or 'loud.' Look at their voting history.\n\n"
-            
-            f"### CURRENT GAME STATE\n"
             f"- {mafia_info}\n"
             f"- Players currently alive: {others_str}\n"
-            f"- Rules: {CONFIG['rules']}\n"
-            f"- History of events:\n{context}\n"
-            f"{self._get_private_context(player)}"
         )
 
-        if distinct_action:
-            system_prompt += "\n🔴 IMPORTANT: Your response must be EXACTLY just the name of the target player. Do not write sentences."
+    def _get_private_context(self, player: Player, memory: Optional[str] = None) -> str:
+        memory_log = memory if memory is not None else player.memory.render()
+        if memory_log:
+            return f"{self.NOTES_HEADER}{memory_log}\n"
+        return ""
+
+
+class LiveLine:
+    """Prints a streamed reply to the console chunk by chunk, after a header."""
+    def __init__(self, header: str):
+        self.header = header
+        self.started = False
+
+    def write(self, chunk: str):
+        if not self.started:
+            chunk = chunk.lstrip()
+            if not chunk:
+                return
+            print(self.header, end="")
+            self.started = True
+        print(chunk, end="", flush=True)
+
+    def reset(self):
+        """Abandons a partial reply before the call is retried."""
+        if self.started:
+            print(" [...]", flush=True)
+            self.started = False
+
+    def close(self):
+        if self.started:
+            print()
+
+
+@dataclass
+class LLMRequest:
+    """Everything a backend may need to answer one call."""
+    player: Player
+    prompt: Prompt
+    instruction: str
+    distinct_action: bool = False
+    candidates: Optional[List[str]] = None
+    all_players: Optional[List[Player]] = None
+    call_class: str = "statement"  # statement, thought, action, mafia_chat or summary
+    stream: Optional[LiveLine] = None  # when set, backends stream chunks to it
+    route: Optional[str] = None  # cheaper model picked by ModelRouter; None = the player's own
+    public_history: bool = True  # False when the prompt's history is a private channel (e.g. Mafia chat)
+
+    # Filled in while the call runs, for telemetry.
+    usage: Dict[str, int] = field(default_factory=dict)
+    attempts: int = 0
+    errors: List[str] = field(default_factory=list)
+    queue_seconds: float = 0.0
+    model_seconds: float = 0.0
+    backoff_seconds: float = 0.0
+    first_token_seconds: Optional[float] = None
+    attempt_started: float = 0.0
+    escalated: bool = False
+
+    @property
+    def model(self) -> str:
+        return self.route or self.player.model_id
+
+    def escalate(self) -> bool:
+        """Moves a routed call onto the player's own model. False if it is already there."""
+        if self.route is None or self.route == self.player.model_id:
+            return False
+        self.route = None
+        self.escalated = True
+        return True
+
+    def emit(self, chunk: str):
+        """Forwards a streamed chunk, timing the first one of the attempt."""
+        if self.first_token_seconds is None:
+            self.first_token_seconds = time.perf_counter() - self.attempt_started
+        self.stream.write(chunk)
+
+
+class LLMBackend(Protocol):
+    """A provider that turns an LLMRequest into response text.
+
+    If the request has a stream, the reply is also passed to request.emit()
+    piece by piece as it arrives; the return value is still the full text.
+    """
+    async def generate(self, request: LLMRequest) -> str: ...
+
+    async def start_day(self, day: int): ...
+
+
+@dataclass
+class _ContextCache:
+    name: str     # provider-side cached-content resource name
+    history: str  # history text that is baked into the cached prefix
+
+
+class GenAIBackend:
+    """Google GenAI provider, with per-role context caching of the prompt prefix.
+
+    Holds one client per configured API key and spreads calls across them
+    round-robin, skipping keys that are cooling down after a rate limit.
+    """
+    # Refused cache creations after which a model is no longer asked.
+    CACHE_FAILURE_LIMIT = 2
+
+    def __init__(self, api_key, extra_api_keys: Sequence[str] = ()):
+        self._clients = []
+        for key in dict.fromkeys([api_key, *extra_api_keys]):
+            try:
+                self._clients.append(genai.Client(api_key=key))
+            except Exception as e:
+                print(f"❌ Error initializing GenAI Client: {e}")
+        self._cooldown_until = [0.0] * len(self._clients)
+        self._next_client = 0
+        self.day = 0
+        # (client, model, role, day) -> cached prefix, or None if the provider refused it
+        self._context_caches: Dict[tuple, Optional[_ContextCache]] = {}
+        self._cache_failures: Counter = Counter()  # model -> refused cache creations
+        self._cache_creations: set = set()  # in-flight background creations
+        self.cache_stats = {"hits": 0, "misses": 0}
+        self._unstructured_models = set()
+
+    def _pick_client(self) -> int:
+        """Next client in rotation that isn't cooling down (or the one that frees up first)."""
+        now = time.monotonic()
+        count = len(self._clients)
+        for offset in range(count):
+            index = (self._next_client + offset) % count
+            if self._cooldown_until[index] <= now:
+                self._next_client = index + 1
+                return index
+        return min(range(count), key=self._cooldown_until.__getitem__)
+
+    async def start_day(self, day: int):
+        """Retires the previous day's cached prefixes; new ones are created lazily."""
+        self.day = day
+        stale = [key for key in self._context_caches if key[3] != day]
+        for key in stale:
+            cache = self._context_caches.pop(key)
+            if cache:
+                try:
+                    await self._clients[key[0]].aio.caches.delete(name=cache.name)
+                except Exception:
+                    pass  # Expires on its own via the TTL.
+
+    def _get_context_cache(self, client_index: int, model: str, role: str, prompt: Prompt) -> Optional[_ContextCache]:
+        """The role's cached prefix for today, if it is ready.
+
+        Only prompts built on the public history share a prefix; callers skip
+        calls whose history is a private channel. The first call that needs a
+        prefix starts creating it in the background and goes uncached, so
+        creation never counts against a call's timeout or retries. Models that
+        keep refusing (e.g. no caching support) are not asked again.
+        """
+        settings = CONFIG["context_caching"]
+        if not settings["enabled"] or not prompt.prefix or self._cache_failures[model] >= self.CACHE_FAILURE_LIMIT:
+            return None
+
+        # Cached content belongs to the key that created it.
+        key = (client_index, model, role, self.day)
+        if key not in self._context_caches:
+            self._context_caches[key] = None
+            task = asyncio.ensure_future(self._create_context_cache(key, prompt))
+            self._cache_creations.add(task)
+            task.add_done_callback(self._cache_creations.discard)
+
+        cache = self._context_caches[key]
+        if cache and prompt.history.startswith(cache.history):
+            return cache
+        return None
+
+    async def _create_context_cache(self, key: tuple, prompt: Prompt):
+        client_index, model, role, day = key
+        client = self._clients[client_index]
+        try:
+            cached = await client.aio.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    contents=[f"{prompt.prefix}{prompt.history}"],
+                    display_name=f"mafia-{role.lower()}-day{day}",
+                    ttl=f"{CONFIG['context_caching']['ttl_seconds']}s",
+                ),
+            )
+        except Exception:
+            self._cache_failures[model] += 1  # Model doesn't support caching, or the prefix is too short.
+            return
+        if key not in self._context_caches:
+            # The day ended while the cache was being created.
+            try:
+                await client.aio.caches.delete(name=cached.name)
+            except Exception:
+                pass  # Expires on its own via the TTL.
+            return
+        self._context_caches[key] = _ContextCache(cached.name, prompt.history)
+
+    async def generate(self, request: LLMRequest) -> str:
+        if not self._clients:
+            raise LLMCallError("No GenAI client could be initialized; check CONFIG['api_key']")
+
+        client_index = self._pick_client()
+        prompt = request.prompt
+        cache = self._get_context_cache(client_index, request.model, request.player.role, prompt) if request.public_history else None
+        config = {}
+        if cache:
+            self.cache_stats["hits"] += 1
+            contents = f"{prompt.history[len(cache.history):]}{prompt.tail}"
+            config["cached_content"] = cache.name
+        else:
+            self.cache_stats["misses"] += 1
+            contents = prompt.text
+
+        structured = (
+            CONFIG["structured_actions"] and request.distinct_action and request.candidates
+            and request.model not in self._unstructured_models
+        )
+        if structured:
+            config["response_mime_type"] = "text/x.enum"
+            config["response_schema"] = {"type": "STRING", "enum": list(request.candidates)}
+
+        try:
+            text, usage = await self._send(client_index, request, contents, config)
+        except genai_errors.ClientError as e:
+            if not (structured and e.code == 400):
+                raise
+            # This model doesn't do constrained decoding; stop asking.
+            self._unstructured_models.add(request.model)
+            del config["response_mime_type"], config["response_schema"]
+            text, usage = await self._send(client_index, request, contents, config)
+
+        if usage:
+            request.usage = {
+                "input_tokens": usage.prompt_token_count or 0,
+                "output_tokens": usage.candidates_token_count or 0,
+                "cached_tokens": usage.cached_content_token_count or 0,
+            }
+        return text.strip()
+
+    async def _send(self, client_index: int, request: LLMRequest, contents: str, config: Dict[str, Any]) -> Tuple[str, Any]:
+        """Returns the reply text and its usage metadata, streaming if the request asks for it."""
+        models = self._clients[client_index].aio.models
+        generate_config = types.GenerateContentConfig(**config) if config else None
+        try:
+            if request.stream is None:
+                response = await models.generate_content(model=request.model, contents=contents, config=generate_config)
+                return response.text or "", response.usage_metadata
+
+            parts, usage = [], None
+            async for chunk in await models.generate_content_stream(model=request.model, contents=contents, config=generate_config):
+                if chunk.text:
+                    parts.append(chunk.text)
+                    request.emit(chunk.text)
+                usage = chunk.usage_metadata or usage
+            return "".join(parts), usage
+        except genai_errors.APIError as e:
+            if e.code == 429:
+                hint = retry_after_hint(e) or CONFIG["retry"]["base_delay_seconds"]
+                self._cooldown_until[client_index] = time.monotonic() + hint
+            raise
+
+
+class MockBackendError(Exception):
+    """Injected failure from MockBackend, handled like any transient API error."""
+
+
+class MockBackend:
+    """Offline, deterministic provider for load tests and CI.
+
+    Replies are seeded from the call itself (seed, speaker, instruction,
+    prompt size and how often that exact call was repeated) rather than from
+    call order, so a game replays identically
+    no matter how its concurrent calls interleave. Action calls pick a
+    plausible target for the actor's role; everything else gets a short
+    canned statement that names another player.
+    """
+    STATEMENTS = [
+        "Nothing has happened yet, so I have nothing to add.",
+        "I don't trust {name}; their reasoning keeps shifting.",
+        "{name} has been very quiet, which makes me uneasy.",
+        "I think {name} is telling the truth, let's look elsewhere.",
+        "Something doesn't add up about {name}'s vote.",
+        "I'm looking at the facts, and {name} keeps deflecting.",
+    ]
+
+    def __init__(self, seed: int = 0, latency_seconds: float = 0.0, error_rate: float = 0.0, invalid_rate: float = 0.0):
+        self.seed = seed
+        self.latency_seconds = latency_seconds
+        self.error_rate = error_rate
+        self.invalid_rate = invalid_rate
+        self._repeats: Dict[str, int] = {}
+
+    async def start_day(self, day: int):
+        self._repeats.clear()
+
+    def _rng(self, request: LLMRequest) -> random.Random:
+        key = f"{self.seed}|{request.player.name}|{request.instruction}|{len(request.prompt.history)}|{len(request.prompt.tail)}"
+        # Identical repeat calls (retries) must not get the identical answer.
+        repeat = self._repeats.get(key, 0)
+        self._repeats[key] = repeat + 1
+        return random.Random(zlib.crc32(f"{key}|{repeat}".encode()))
+
+    async def generate(self, request: LLMRequest) -> str:
+        reply = await self._reply(request)
+        if request.stream is not None:
+            for word in re.findall(r"\S+\s*", reply):
+                request.emit(word)
+                await asyncio.sleep(0)
+        request.usage = {"input_tokens": estimate_tokens(request.prompt.text), "output_tokens": estimate_tokens(reply)}
+        return reply
+
+    async def _reply(self, request: LLMRequest) -> str:
+        rng = self._rng(request)
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds * rng.uniform(0.5, 1.5))
+        if rng.random() < self.error_rate:
+            raise MockBackendError(f"Injected failure for {request.player.name}")
+
+        if request.player.role == "Moderator":
+            return "Summary: " + " ".join(request.prompt.tail.split()[-40:])
+
+        others = [p for p in request.all_players or [] if p.is_alive and p.name != request.player.name]
+        if request.distinct_action:
+            if rng.random() < self.invalid_rate:
+                return "I'm not sure yet."
+            return self._pick_target(request, others, rng)
+
+        if not others:
+            return rng.choice(self.STATEMENTS[:1])
+        return rng.choice(self.STATEMENTS[1:]).format(name=rng.choice(others).name)
+
+    def _pick_target(self, request: LLMRequest, others: List[Player], rng: random.Random) -> str:
+        player = request.player
+        candidates = request.candidates or [p.name for p in others]
+        if not candidates:
+            return "Skip"
+        roles = {p.name: p.role for p in request.all_players or []}
+        names = [c for c in candidates if c != "Skip"]
+
+        # Mafia never target their own; everyone else avoids themselves,
+        # except a Doctor choosing whom to protect.
+        if player.role == "Mafia":
+            preferred = [n for n in names if roles.get(n) != "Mafia"]
+        elif player.role == "Doctor" and "SAVE" in request.instruction:
+            preferred = names
+        else:
+            preferred = [n for n in names if n != player.name]
+
+        # A Detective who has found Mafia acts on it.
+        if player.role == "Detective":
+            notes = player.memory.render()
+            suspects = [n for n in preferred if f"Investigated {n}. Result: Mafia" in notes]
+            if suspects:
+                preferred = suspects
+
+        if "Skip" in candidates and rng.random() < 0.1:
+            return "Skip"
+        return rng.choice(preferred or candidates)
+
+
+def make_backend() -> LLMBackend:
+    """Builds the backend selected by CONFIG['backend']."""
+    if CONFIG["backend"] == "mock":
+        return MockBackend(**CONFIG["mock"])
+    return GenAIBackend(CONFIG["api_key"], CONFIG["api_keys"])
+
+
+class CacheMissError(Exception):
+    """Raised in replay mode when a call has no recorded response."""
+
+
+class ResponseCache:
+    """Content-addressed store of LLM responses for record/replay.
+
+    Keys hash the model id, the fully assembled prompt and how many times that
+    exact prompt was already requested in this game, so repeated identical
+    calls (e.g. a retry after the same invalid reply) each get their own
+    entry. Responses live in SQLite on disk with a size-bounded in-memory
+    LRU in front.
+
+    Modes:
+        "record"       - always call the backend and store the response.
+        "replay"       - only serve stored responses; a miss raises CacheMissError.
+        "read_through" - serve stored responses, call and store on a miss.
+    """
+    MODES = ("record", "replay", "read_through")
+
+    def __init__(self, path: str, mode: str = "read_through", memory_bytes: int = 64 * 1024 * 1024):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown response cache mode '{mode}'. Expected one of: {', '.join(self.MODES)}")
+        self.mode = mode
+        self.memory_bytes = memory_bytes
+        self._lru: "OrderedDict[str, str]" = OrderedDict()
+        self._lru_bytes = 0
+        self._occurrences: Dict[str, int] = {}
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, model TEXT, response TEXT)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self.stats = {"hits": 0, "misses": 0, "bytes_saved": 0}
+
+    def key(self, model: str, prompt: str) -> str:
+        digest = hashlib.sha256(f"{model}\0{prompt}".encode()).hexdigest()
+        occurrence = self._occurrences.get(digest, 0)
+        self._occurrences[digest] = occurrence + 1
+        return f"{digest}:{occurrence}"
+
+    def get(self, key: str) -> Optional[str]:
+        if key in self._lru:
+            self._lru.move_to_end(key)
+            return self._lru[key]
+        row = self._db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._remember(key, row[0])
+        return row[0]
+
+    def put(self, key: str, model: str, response: str):
+        self._db.execute("INSERT OR REPLACE INTO responses (key, model, response) VALUES (?, ?, ?)", (key, model, response))
+        self._remember(key, response)
+
+    def _remember(self, key: str, response: str):
+        if key in self._lru:
+            self._lru_bytes -= len(self._lru.pop(key))
+        self._lru[key] = response
+        self._lru_bytes += len(response)
+        while self._lru_bytes > self.memory_bytes and self._lru:
+            _, evicted = self._lru.popitem(last=False)
+            self._lru_bytes -= len(evicted)
 
-        full_prompt = f"{system_prompt}\n\nINSTRUCTION: {instruction}"
+    def get_meta(self, name: str) -> Optional[str]:
+        """Recording-wide settings a replay must reuse, such as the game seed."""
+        row = self._db.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
 
+    def set_meta(self, name: str, value: str):
+        self._db.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value))
+
+    def record_hit(self, prompt: str, response: str):
+        self.stats["hits"] += 1
+        self.stats["bytes_saved"] += len(prompt.encode()) + len(response.encode())
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+    def close(self):
+        self._db.close()
+
+
+def make_response_cache() -> Optional[ResponseCache]:
+    """Builds the response cache selected by CONFIG['response_cache'], if any."""
+    settings = CONFIG["response_cache"]
+    if settings["mode"] == "off":
+        return None
+    return ResponseCache(settings["path"], settings["mode"], settings["memory_bytes"])
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) for budgeting."""
+    return len(text) // 4 + 1
+
+
+class LLMCallError(Exception):
+    """An LLM call failed for good: a fatal error, exhausted retries or a missed deadline."""
+
+
+def classify_error(error: Exception) -> str:
+    """Sorts a failed call into "rate_limited", "retryable" or "fatal"."""
+    if isinstance(error, genai_errors.APIError):
+        if error.code == 429:
+            return "rate_limited"
+        if error.code in (408, 409) or error.code >= 500:
+            return "retryable"
+        return "fatal"  # Bad key, bad request, unknown model, permission denied...
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError, httpx.TransportError, MockBackendError)):
+        return "retryable"
+    return "fatal"
+
+
+def retry_after_hint(error: Exception) -> Optional[float]:
+    """Seconds the server asked us to wait, from a RetryInfo detail or Retry-After header."""
+    details = getattr(error, "details", None)
+    if isinstance(details, dict):
+        for detail in details.get("error", details).get("details", []) or []:
+            delay = detail.get("retryDelay") if isinstance(detail, dict) else None
+            if delay:
+                try:
+                    return float(str(delay).rstrip("s"))
+                except ValueError:
+                    pass
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if headers and headers.get("retry-after"):
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            pass
+    return None
+
+
+class TokenBucket:
+    """Refills `per_minute` units evenly over a minute; acquiring waits for capacity."""
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.level = per_minute
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    async def acquire(self, amount: float = 1):
+        amount = min(amount, self.capacity)
         while True:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.level >= amount:
+                self.level -= amount
+                return
+            await asyncio.sleep((amount - self.level) / self.rate)
+
+
+class RequestExecutor:
+    """Runs backend calls with classification, backoff, rate limits and deadlines.
+
+    Rate-limited and retryable failures back off exponentially with full
+    jitter, never waiting less than the server's retry hint. Fatal errors,
+    exhausted retries and missed deadlines raise LLMCallError instead of
+    hanging the game.
+    """
+    def __init__(self, settings: Dict[str, Any], max_retries: float, rate_limits: Dict[str, Dict[str, float]]):
+        self.settings = settings
+        self.max_retries = max_retries
+        self.rate_limits = rate_limits
+        self._buckets: Dict[str, List[TokenBucket]] = {}
+        self.deadline: Optional[float] = None
+        self.stats = {"retries": 0, "rate_limited": 0, "fatal": 0, "escalations": 0}
+
+    def start_game(self):
+        budget = self.settings["game_deadline_seconds"]
+        self.deadline = time.monotonic() + budget if budget else None
+
+    def _limits_for(self, model: str) -> List[TokenBucket]:
+        if model not in self._buckets:
+            limits = self.rate_limits.get(model) or self.rate_limits.get("default") or {}
+            self._buckets[model] = [
+                TokenBucket(limits["rpm"]) if limits.get("rpm") else None,
+                TokenBucket(limits["tpm"]) if limits.get("tpm") else None,
+            ]
+        return self._buckets[model]
+
+    def _backoff(self, attempt: int, hint: Optional[float]) -> float:
+        ceiling = min(self.settings["max_delay_seconds"], self.settings["base_delay_seconds"] * 2 ** attempt)
+        return max(random.uniform(0, ceiling), hint or 0)
+
+    async def run(self, request: LLMRequest, call: Callable[[LLMRequest, Optional[float]], Awaitable[str]]) -> str:
+        """Runs `call` with retries; `call` applies the per-attempt timeout to the model call alone."""
+        attempt = 0
+        while True:
+            if self.deadline and time.monotonic() > self.deadline:
+                raise LLMCallError("Game deadline exceeded")
+            requests_bucket, tokens_bucket = self._limits_for(request.model)
+            queued = time.perf_counter()
+            if requests_bucket:
+                await requests_bucket.acquire()
+            if tokens_bucket:
+                await tokens_bucket.acquire(estimate_tokens(request.prompt.text))
+            request.queue_seconds += time.perf_counter() - queued
+
+            timeout = self.settings["call_timeout_seconds"]
+            if self.deadline:
+                timeout = min(timeout or float("inf"), max(0.0, self.deadline - time.monotonic()))
             try:
-                response = self.client.models.generate_content(
-                    model=player.model_id,
-                    contents=full_prompt
-                )
-                return response.text.strip() if response.text else ""
-                
+                return await call(request, timeout)
             except Exception as e:
-                time.sleep(5)
+                kind = classify_error(e)
+                request.errors.append(kind)
+                if kind == "fatal":
+                    self.stats["fatal"] += 1
+                    raise LLMCallError(f"{request.model} call for {request.player.name} failed: {e}") from e
+                if attempt >= self.max_retries:
+                    raise LLMCallError(f"{request.model} call for {request.player.name} failed after {attempt + 1} attempts: {e}") from e
+                if kind == "rate_limited":
+                    self.stats["rate_limited"] += 1
+                if isinstance(e, asyncio.TimeoutError) and self.settings.get("escalate_on_timeout") and request.escalate():
+                    self.stats["escalations"] += 1
+                self.stats["retries"] += 1
+                delay = self._backoff(attempt, retry_after_hint(e))
+                request.backoff_seconds += delay
+                await asyncio.sleep(delay)
+                attempt += 1
 
-    def _get_private_context(self, player: Player) -> str:
-        if player.private_memory:
-            memory_log = "\n".join(player.private_memory)
-            return f"\n🧠 YOUR INTERNAL MONOLOGUE & NOTES:\n{memory_log}\n"
-        return ""
+
+class ContextBudget:
+    """Keeps each prompt under a token budget, between GameEngine and the LLM.
+
+    Prompts that already fit are left untouched. Otherwise the public history
+    keeps the most recent days verbatim and replaces older days with one
+    summary each; summaries are generated once per day and shared by every
+    player. Private memory keeps pinned facts (e.g. investigation results)
+    plus as many recent notes as still fit. If the prompt is still over
+    budget, the oldest history entries (summaries first, then verbatim lines)
+    are dropped. Every call's estimated prompt size before and after fitting
+    is recorded in `records`.
+    """
+    def __init__(self, llm: "LLMInterface", history: GameHistory, settings: Dict[str, Any], roster: Optional[Roster] = None):
+        self.llm = llm
+        self.history = history
+        self.settings = settings
+        self.roster = roster
+        self._state_tokens: Dict[tuple, int] = {}  # (player, alive count) -> state block estimate
+        self.day = 0
+        self.summaries: Dict[int, str] = {}
+        self._summary_tasks: Dict[int, asyncio.Task] = {}
+        self.records: List[Dict[str, Any]] = []
+
+    def start_day(self, day: int):
+        """Marks where `day` begins in the public history."""
+        self.day = day
+        self.history.mark(day)
+
+    async def fit(self, player: Player, instruction: str, context: Union[str, HistorySnapshot, None] = None, distinct_action: bool = False) -> Tuple[str, Optional[str]]:
+        """Returns (history, memory) text for a call.
+
+        A string `context` overrides the public history; a HistorySnapshot
+        pins it at that version.
+        """
+        version = context.version if isinstance(context, HistorySnapshot) else None
+        public = not isinstance(context, str)
+        history = self.history.render(version) if public else context
+        if not self.settings["enabled"]:
+            return history, None
+
+        memory = player.memory.render()
+        budget = self.settings["max_prompt_tokens"]
+        fixed = self._fixed_tokens(player, instruction, distinct_action)
+        before = fixed + estimate_tokens(history) + estimate_tokens(memory)
+        after = before
+        if before > budget:
+            if public:
+                pinned = sum(estimate_tokens(line) for line, is_pinned in player.memory.entries() if is_pinned)
+                lines = self._trim_oldest(await self._compressed_lines(version), budget - fixed - pinned)
+                history = "\n".join(lines)
+            memory = self._fit_memory(player, budget - fixed - estimate_tokens(history))
+            after = fixed + estimate_tokens(history) + estimate_tokens(memory)
+
+        self.records.append({"player": player.name, "day": self.day, "before": before, "after": after})
+        return history, memory
+
+    def _fixed_tokens(self, player: Player, instruction: str, distinct_action: bool) -> int:
+        """Size of everything but the history and notes, without assembling the prompt.
+
+        The state block only changes when someone is eliminated, so its
+        estimate is cached per player and alive count.
+        """
+        prompts = self.llm.prompts
+        key = (player.name, len(self.roster) if self.roster else 0)
+        state = self._state_tokens.get(key)
+        if state is None:
+            state = self._state_tokens[key] = estimate_tokens(prompts.state_block(player, self.roster.players if self.roster else None))
+        fixed = estimate_tokens(prompts.role_prefix(player.role)) + state + estimate_tokens(prompts.NOTES_HEADER) + estimate_tokens(f"\n\nINSTRUCTION: {instruction}")
+        return fixed + estimate_tokens(prompts.ACTION_NOTE) if distinct_action else fixed
+
+    async def compressed_history(self, version: Optional[int] = None) -> str:
+        """Public history (as of `version`) with days older than `keep_recent_days` replaced by summaries."""
+        return "\n".join(await self._compressed_lines(version))
+
+    async def _compressed_lines(self, version: Optional[int] = None) -> List[str]:
+        end = self.history.version if version is None else version
+        first_kept = self.day - self.settings["keep_recent_days"] + 1
+        old_days = [d for d in range(1, first_kept) if d in self.history.marks]
+        if not old_days:
+            return self.history[:end]
+
+        summaries = await asyncio.gather(*(self._summary(d) for d in old_days))
+        lines = self.history[:self.history.marks[old_days[0]]]
+        lines += [f"[Summary of Day {d}] {summary}" for d, summary in zip(old_days, summaries)]
+        lines += self.history[min(self.history.marks.get(first_kept, end), end):end]
+        return lines
+
+    @staticmethod
+    def _trim_oldest(lines: List[str], budget: int) -> List[str]:
+        """Drops entries from the front until the rest, and a note saying so, fit in `budget` tokens."""
+        used = sum(estimate_tokens(line) for line in lines)
+        if used <= budget:
+            return lines
+        budget -= estimate_tokens(f"(… {len(lines)} earlier entries omitted)")
+        start = 0
+        while start < len(lines) and used > budget:
+            used -= estimate_tokens(lines[start])
+            start += 1
+        return [f"(… {start} earlier entries omitted)", *lines[start:]]
+
+    async def _summary(self, day: int) -> str:
+        if day in self.summaries:
+            return self.summaries[day]
+        if day not in self._summary_tasks:
+            task = asyncio.ensure_future(self._summarize(day))
+            task.add_done_callback(lambda done: self._forget_failed_summary(day, done))
+            self._summary_tasks[day] = task
+        # Shielded: the task is shared, so one cancelled caller must not cancel it for the rest.
+        return await asyncio.shield(self._summary_tasks[day])
+
+    def _forget_failed_summary(self, day: int, task: asyncio.Task):
+        """Drops a summary task that was cancelled or failed, so the next caller tries again."""
+        if task.cancelled() or task.exception() is not None:
+            if self._summary_tasks.get(day) is task:
+                del self._summary_tasks[day]
+
+    async def _summarize(self, day: int) -> str:
+        end = self.history.marks.get(day + 1, self.history.version)
+        events = self.history.render_range(self.history.marks[day], end)
+        summary = await self.llm.complete(
+            self.settings["summary_model"] or CONFIG["models"]["town"],
+            f"Summarize these events from Night/Day {day} of a game of Mafia in at most 5 short bullet points. "
+            f"Keep who died and their revealed roles, who accused whom, and how each player voted. "
+            f"Do not speculate.\n\n{events}",
+        )
+        self.summaries[day] = " ".join(summary.split())
+        return self.summaries[day]
+
+    def _fit_memory(self, player: Player, budget: int) -> str:
+        entries = list(player.memory.entries())
+        budget -= estimate_tokens(f"(… {len(entries)} older notes omitted)")
+        kept = [pinned for _, pinned in entries]
+        used = sum(estimate_tokens(line) for line, pinned in entries if pinned)
+        for i in range(len(entries) - 1, -1, -1):
+            line, pinned = entries[i]
+            if pinned:
+                continue
+            cost = estimate_tokens(line)
+            if used + cost > budget:
+                break
+            kept[i] = True
+            used += cost
+        lines = [line for (line, _), keep in zip(entries, kept) if keep]
+        if len(lines) < len(entries):
+            lines.insert(0, f"(… {len(entries) - len(lines)} older notes omitted)")
+        return "\n".join(lines)
+
+    def report(self) -> str:
+        fitted = [r for r in self.records if r["after"] < r["before"]]
+        if not self.records:
+            return "no prompts"
+        line = f"{len(fitted)}/{len(self.records)} prompts compressed"
+        if fitted:
+            before = sum(r["before"] for r in fitted) / len(fitted)
+            after = sum(r["after"] for r in fitted) / len(fitted)
+            line += f", avg {before:.0f} → {after:.0f} est. tokens"
+        return line + f", largest prompt {max(r['after'] for r in self.records)} est. tokens"
+
+
+_CURRENT_SPAN: ContextVar[Optional["Span"]] = ContextVar("_CURRENT_SPAN", default=None)
+
+
+@dataclass
+class Span:
+    id: int
+    parent: Optional["Span"]
+    kind: str  # game, night, day, phase, actor or llm_call
+    name: str
+    start: float
+    end: Optional[float] = None
+    attrs: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def ancestor(self, *kinds: str) -> Optional["Span"]:
+        span = self.parent
+        while span is not None and span.kind not in kinds:
+            span = span.parent
+        return span
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "parent": self.parent.id if self.parent else None,
+            "kind": self.kind,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "duration": round(self.duration, 6),
+            **self.attrs,
+        }
+
+
+class Telemetry:
+    """Spans for game/day/night/phase/actor/LLM call, plus per-call metrics.
+
+    Spans nest through a context variable, so tasks started by PhaseScheduler
+    are parented to the phase that started them. Every LLM call records its
+    token usage, queue time (rate limits and concurrency slots), model time,
+    backoff time and attempts, attributed to the enclosing phase and role.
+    """
+    def __init__(self, enabled: bool = True, prices: Optional[Dict[str, Dict[str, float]]] = None):
+        self.enabled = enabled
+        self.prices = prices or {}
+        self.spans: List[Span] = []
+        self.calls: List[Dict[str, Any]] = []
+        self._ids = itertools.count(1)
+
+    @contextmanager
+    def span(self, kind: str, name: str, **attrs):
+        if not self.enabled:
+            yield None
+            return
+        span = Span(next(self._ids), _CURRENT_SPAN.get(), kind, name, time.perf_counter(), attrs=attrs)
+        token = _CURRENT_SPAN.set(span)
+        try:
+            yield span
+        finally:
+            span.end = time.perf_counter()
+            _CURRENT_SPAN.reset(token)
+            self.spans.append(span)
+
+    def record_call(self, span: Optional[Span], request: LLMRequest, outcome: str = "ok"):
+        """Records a finished call; `outcome` is ok, cached, failed, cache_miss or cancelled."""
+        if span is None:
+            return
+        period = span.ancestor("night", "day")
+        phase = span.ancestor("phase")
+        price = self.prices.get(request.model) or self.prices.get("default") or {}
+        input_tokens, output_tokens = request.usage.get("input_tokens", 0), request.usage.get("output_tokens", 0)
+        record = {
+            "period": period.name if period else None,
+            "phase": phase.name if phase else None,
+            "player": request.player.name,
+            "role": request.player.role,
+            "model": request.model,
+            "call_class": request.call_class,
+            "outcome": outcome,
+            "cached": outcome == "cached",
+            "attempts": request.attempts,
+            "retries": max(0, request.attempts - 1),
+            "errors": list(request.errors),
+            "escalated": request.escalated,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "cost_usd": (input_tokens * price.get("input", 0.0) + output_tokens * price.get("output", 0.0)) / 1e6,
+            "cached_tokens": request.usage.get("cached_tokens", 0),
+            "queue_seconds": round(request.queue_seconds, 6),
+            "model_seconds": round(request.model_seconds, 6),
+            "backoff_seconds": round(request.backoff_seconds, 6),
+            "first_token_seconds": None if request.first_token_seconds is None else round(request.first_token_seconds, 6),
+        }
+        span.attrs.update(record)
+        self.calls.append(record)
+
+    def totals(self) -> Dict[str, Any]:
+        return {
+            "llm_calls": len(self.calls),
+            "input_tokens": sum(c["input_tokens"] for c in self.calls),
+            "output_tokens": sum(c["output_tokens"] for c in self.calls),
+            "retries": sum(c["retries"] for c in self.calls),
+            "escalations": sum(c["escalated"] for c in self.calls),
+            "failed_calls": sum(c["outcome"] not in ("ok", "cached") for c in self.calls),
+            "cost_usd": round(sum(c["cost_usd"] for c in self.calls), 6),
+            "model_seconds": round(sum(c["model_seconds"] for c in self.calls), 3),
+            "queue_seconds": round(sum(c["queue_seconds"] for c in self.calls), 3),
+        }
+
+    def write_trace(self, path: str):
+        """Appends every finished span (LLM calls included) as one JSON line each."""
+        with open(path, "a") as f:
+            for span in sorted(self.spans, key=lambda s: s.start):
+                f.write(json.dumps(span.to_dict()) + "\n")
+
+    def prometheus_text(self) -> str:
+        """Metrics in the Prometheus text exposition format."""
+        counters = defaultdict(float)
+        for c in self.calls:
+            labels = f'phase="{c["phase"]}",role="{c["role"]}",model="{c["model"]}",call_class="{c["call_class"]}"'
+            counters[("mafia_llm_calls_total", labels)] += 1
+            counters[("mafia_llm_retries_total", labels)] += c["retries"]
+            counters[("mafia_llm_input_tokens_total", labels)] += c["input_tokens"]
+            counters[("mafia_llm_output_tokens_total", labels)] += c["output_tokens"]
+            counters[("mafia_llm_model_seconds_total", labels)] += c["model_seconds"]
+            counters[("mafia_llm_queue_seconds_total", labels)] += c["queue_seconds"]
+            counters[("mafia_llm_backoff_seconds_total", labels)] += c["backoff_seconds"]
+            counters[("mafia_llm_cost_usd_total", labels)] += c["cost_usd"]
+            counters[("mafia_llm_escalations_total", labels)] += c["escalated"]
+            counters[("mafia_llm_failed_calls_total", labels)] += c["outcome"] not in ("ok", "cached")
+            if c["first_token_seconds"] is not None:
+                counters[("mafia_llm_streamed_calls_total", labels)] += 1
+                counters[("mafia_llm_first_token_seconds_total", labels)] += c["first_token_seconds"]
+        for span in self.spans:
+            if span.kind in ("phase", "night", "day", "game"):
+                counters[("mafia_span_seconds_total", f'kind="{span.kind}",name="{span.name}"')] += span.duration
+
+        lines = []
+        for metric in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE {metric} counter")
+            for (name, labels), value in sorted(counters.items()):
+                if name == metric:
+                    # Exact values: %g would round large token counters to 6 significant digits.
+                    lines.append(f"{name}{{{labels}}} {int(value) if value.is_integer() else repr(value)}")
+        return "\n".join(lines) + "\n"
+
+    def summary_table(self) -> str:
+        """Per-phase, per-role and per-route breakdown of calls, tokens, time and cost."""
+        lines = []
+        for key in ("phase", "role", "route"):
+            rows = defaultdict(lambda: [0, 0, 0, 0, 0.0, 0.0, 0.0])
+            for c in self.calls:
+                row = rows[f"{c['call_class']} -> {c['model']}" if key == "route" else c[key] or "-"]
+                row[0] += 1
+                row[1] += c["retries"]
+                row[2] += c["input_tokens"]
+                row[3] += c["output_tokens"]
+                row[4] += c["model_seconds"]
+                row[5] += c["queue_seconds"]
+                row[6] += c["cost_usd"]
+            lines.append(f"  {key:<34}{'calls':>7}{'retries':>9}{'in tok':>10}{'out tok':>10}{'model s':>10}{'avg s':>8}{'queue s':>10}{'cost $':>10}")
+            for name, (calls, retries, tok_in, tok_out, model_s, queue_s, cost) in sorted(rows.items(), key=lambda kv: -kv[1][4]):
+                lines.append(f"  {name:<34}{calls:>7}{retries:>9}{tok_in:>10}{tok_out:>10}{model_s:>10.2f}{model_s / calls:>8.2f}{queue_s:>10.2f}{cost:>10.4f}")
+            lines.append("")
+        escalations = sum(c["escalated"] for c in self.calls)
+        if escalations:
+            lines.append(f"  escalated to the player's model: {escalations} calls")
+        failures = Counter(c["outcome"] for c in self.calls if c["outcome"] not in ("ok", "cached"))
+        if failures:
+            lines.append("  calls that did not return: " + ", ".join(f"{count} {outcome}" for outcome, count in failures.most_common()))
+        phases = defaultdict(float)
+        for span in self.spans:
+            if span.kind == "phase":
+                phases[span.name] += span.duration
+        first_tokens = sorted(c["first_token_seconds"] for c in self.calls if c["first_token_seconds"] is not None)
+        if first_tokens:
+            lines.append(f"  time to first token: median {first_tokens[len(first_tokens) // 2]:.2f}s, max {first_tokens[-1]:.2f}s over {len(first_tokens)} streamed calls")
+        if phases:
+            lines.append("  wall time by phase: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in sorted(phases.items(), key=lambda kv: -kv[1])))
+        return "\n".join(lines)
+
+
+class ModelRouter:
+    """Picks the model for a call from its call class (CONFIG["routing"])."""
+    def __init__(self, settings: Dict[str, Any]):
+        self.settings = settings
+
+    def route(self, player: Player, call_class: str) -> Optional[str]:
+        """The routed model, or None when the player's own model should answer."""
+        if not self.settings["enabled"]:
+            return None
+        model = self.settings["routes"].get(call_class)
+        return model if model != player.model_id else None
+
+
+class LLMInterface:
+    """Builds prompts and hands them to a pluggable LLM backend."""
+    def __init__(self, backend: LLMBackend, max_concurrent_requests: int = 1, response_cache: Optional[ResponseCache] = None, request_limiter=None, telemetry: Optional[Telemetry] = None):
+        self.backend = backend
+        self.telemetry = telemetry or Telemetry(enabled=False)
+        rate_limits = CONFIG["rate_limits"] if isinstance(backend, GenAIBackend) else {}
+        self.executor = RequestExecutor({**CONFIG["retry"], "escalate_on_timeout": CONFIG["routing"]["escalate_on_timeout"]}, CONFIG["max_retries"], rate_limits)
+        self.router = ModelRouter(CONFIG["routing"])
+        self.response_cache = response_cache
+        # Optional cross-process limit (e.g. a multiprocessing semaphore shared
+        # by a tournament's workers), held for the duration of each API call.
+        self.request_limiter = request_limiter
+        self.api_calls = 0
+        # Model that answered each player's latest call, which routing and
+        # escalation can make differ from the player's own.
+        self.answered_by: Dict[str, str] = {}
+        self._slots = asyncio.Semaphore(max(1, max_concurrent_requests))
+        self.prompts = PromptBuilder()
+
+    @property
+    def cache_stats(self) -> Optional[Dict[str, int]]:
+        return getattr(self.backend, "cache_stats", None)
+
+    async def start_day(self, day: int):
+        await self.backend.start_day(day)
+
+    async def generate(self, player: Player, context: str, instruction: str, distinct_action: bool = False, all_players: List[Player] = None, candidates: Optional[List[str]] = None, memory: Optional[str] = None, call_class: str = "statement", stream: Optional[LiveLine] = None, escalate: bool = False, public_history: bool = True) -> str:
+        prompt = self.prompts.build(player, context, instruction, distinct_action, all_players, memory)
+        route = self.router.route(player, call_class)
+        request = LLMRequest(player, prompt, instruction, distinct_action, candidates, all_players, call_class, stream, None if escalate else route, public_history)
+        request.escalated = escalate and route is not None
+        return await self._execute(request)
+
+    async def complete(self, model: str, text: str) -> str:
+        """Sends a bare prompt with no game framing, for moderator tasks such as summaries."""
+        moderator = Player("Moderator", "Moderator", model)
+        return await self._execute(LLMRequest(moderator, Prompt("", "", text), text, call_class="summary"))
+
+    async def _execute(self, request: LLMRequest) -> str:
+        with self.telemetry.span("llm_call", request.call_class) as span:
+            # Recorded however the call ends, so failed calls keep their attempts, errors and backoff.
+            outcome = "failed"
+            try:
+                response, cached = await self._execute_cached(request)
+                outcome = "cached" if cached else "ok"
+            except CacheMissError:
+                outcome = "cache_miss"
+                raise
+            except asyncio.CancelledError:
+                outcome = "cancelled"
+                raise
+            finally:
+                self.telemetry.record_call(span, request, outcome)
+        self.answered_by[request.player.name] = request.model
+        return response
+
+    async def _execute_cached(self, request: LLMRequest) -> Tuple[str, bool]:
+        player, prompt, instruction = request.player, request.prompt, request.instruction
+        cache = self.response_cache
+        if cache:
+            full_prompt = prompt.text
+            keyed_model = request.model
+            key = cache.key(keyed_model, full_prompt)
+            if cache.mode != "record":
+                cached = cache.get(key)
+                if cached is not None:
+                    cache.record_hit(full_prompt, cached)
+                    return cached, True
+            cache.stats["misses"] += 1
+            if cache.mode == "replay":
+                raise CacheMissError(f"No recorded response for {player.name} ({request.model}): {instruction[:60]!r}")
+
+        response = await self.executor.run(request, self._call_backend)
+
+        # An escalated call was answered by another model than the key names; don't file it under it.
+        if cache and request.model == keyed_model:
+            cache.put(key, request.model, response)
+        return response, False
+
+    async def _acquire_limiter(self):
+        """Takes a permit from the cross-process limiter.
+
+        The blocking acquire runs in a worker thread that cannot be
+        interrupted, so if this coroutine is cancelled the permit is handed
+        back as soon as the thread obtains it.
+        """
+        acquiring = asyncio.ensure_future(asyncio.to_thread(self.request_limiter.acquire))
+        try:
+            await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            acquiring.add_done_callback(lambda f: f.cancelled() or f.exception() or self.request_limiter.release())
+            raise
+
+    async def _call_backend(self, request: LLMRequest, timeout: Optional[float] = None) -> str:
+        """One attempt. Only the model call counts toward `timeout`, not the wait for a slot."""
+        queued = time.perf_counter()
+        async with self._slots:
+            if self.request_limiter is not None:
+                await self._acquire_limiter()
+            try:
+                started = time.perf_counter()
+                request.queue_seconds += started - queued
+                self.api_calls += 1
+                request.attempts += 1
+                request.attempt_started = started
+                request.first_token_seconds = None
+                try:
+                    return await asyncio.wait_for(self.backend.generate(request), timeout)
+                except BaseException:
+                    if request.stream is not None:
+                        request.stream.reset()
+                    raise
+                finally:
+                    request.model_seconds += time.perf_counter() - started
+            finally:
+                if self.request_limiter is not None:
+                    self.request_limiter.release()
+
+
+# Decisions made by a player (or by chance, for "speakers" and "killer"). On resume these are
+# answered from the log instead of by a model; every other event is derived.
+DECISION_EVENTS = ("statement", "thought", "mafia_chat", "speakers", "nominate", "killer", "kill", "save", "investigate", "vote")
+
+
+class EventLogError(Exception):
+    """Raised when a resumed game no longer matches its event log."""
+
+
+@dataclass
+class GameEvent:
+    """One state transition: a player's decision, or something that followed from one."""
+    kind: str
+    day: int
+    period: str = ""  # night or day
+    actor: Optional[str] = None
+    target: Optional[str] = None
+    text: Optional[str] = None
+    data: Optional[Dict[str, Any]] = None
+
+    @property
+    def key(self) -> tuple:
+        return (self.kind, self.day, self.period, self.actor)
+
+    def to_json(self) -> str:
+        fields = {"kind": self.kind, "day": self.day, "period": self.period, "actor": self.actor, "target": self.target, "text": self.text, "data": self.data}
+        # An empty reply is still a reply: only unset fields are left out.
+        return json.dumps({k: v for k, v in fields.items() if v is not None}, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, line: str) -> "GameEvent":
+        return cls(**json.loads(line))
+
+
+class EventLog:
+    """Append-only JSONL file of GameEvents, flushed after every event."""
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(path):
+            # Drop a final line cut short by a crash before appending to it.
+            with open(path, "rb+") as f:
+                f.truncate(f.read().rfind(b"\n") + 1)
+        self._file = open(path, "a")
+
+    def append(self, event: GameEvent):
+        self._file.write(event.to_json() + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    @staticmethod
+    def read(path: str) -> List[GameEvent]:
+        """Loads every event, ignoring a final line cut short by a crash."""
+        events = []
+        with open(path) as f:
+            for line in f:
+                try:
+                    events.append(GameEvent.from_json(line))
+                except (json.JSONDecodeError, TypeError):
+                    break
+        return events
+
+
+def fold_events(events: Iterable[GameEvent]) -> Dict[str, Any]:
+    """Folds a game's events into its state in a single pass.
+
+    No engine or prompts are built, so this is cheap enough to scan whole
+    archives of games. Snapshots reset the alive set, which also makes a
+    log that starts mid-game foldable. Votes and night actions carry the
+    model that answered them, or the actor's seat model for older logs.
+    """
+    state = {"roster": {}, "day": 0, "alive": set(), "eliminations": [], "votes": [], "actions": [], "winner": None}
+    for event in events:
+        kind = event.kind
+        if kind in ("statement", "thought", "mafia_chat", "killer"):
+            continue
+        if kind in ("vote", "kill", "save", "investigate"):
+            model = (event.data or {}).get("model") or state["roster"].get(event.actor, {}).get("model")
+            if kind == "vote":
+                state["votes"].append((event.day, event.actor, event.target, model))
+            else:
+                state["actions"].append((event.day, kind, event.actor, event.target, model))
+        elif kind == "elimination":
+            state["alive"].discard(event.actor)
+            state["eliminations"].append({"day": event.day, "name": event.actor, "role": state["roster"].get(event.actor, {}).get("role"), "cause": event.text})
+        elif kind == "snapshot":
+            state["day"] = event.day
+            state["alive"] = set(event.data["alive"])
+        elif kind == "game_start":
+            state["roster"] = {name: {"role": role, "model": model} for name, role, model in event.data["roster"]}
+            state["alive"] = set(state["roster"])
+        elif kind == "game_over":
+            state["winner"] = event.target
+    return state
+
+
+@dataclass
+class _PhaseNode:
+    name: str
+    action: Callable[..., Awaitable[Any]]
+    args: tuple
+    after: tuple
+    buffer: list = field(default_factory=list)
+    committed: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class PhaseScheduler:
+    """Runs a phase's LLM-bound actions as a small dependency graph.
+
+    Nodes are declared in the order a serial run would execute them. A node
+    starts once everything it depends on has committed, so independent actors
+    run concurrently. Every node after the first buffers its log output, and
+    buffers are committed in declaration order so the console and shared
+    history read exactly like a serial run.
+    """
+    def __init__(self, engine: "GameEngine"):
+        self.engine = engine
+        self._nodes: Dict[str, _PhaseNode] = {}
+
+    def add(self, name: str, action: Callable[..., Awaitable[Any]], *args, after: Sequence[str] = ()) -> "PhaseScheduler":
+        if name in self._nodes:
+            raise ValueError(f"Duplicate phase node '{name}'")
+        missing = [dep for dep in after if dep not in self._nodes]
+        if missing:
+            raise ValueError(f"Phase node '{name}' depends on undeclared node(s): {', '.join(missing)}")
+        self._nodes[name] = _PhaseNode(name, action, args, tuple(after))
+        return self
+
+    async def _run_node(self, node: _PhaseNode, live: bool) -> Any:
+        for dep in node.after:
+            await self._nodes[dep].committed.wait()
+        if not live:
+            _LOG_BUFFER.set(node.buffer)
+        return await node.action(*node.args)
+
+    async def run(self) -> Dict[str, Any]:
+        """Runs every node and returns their results keyed by node name."""
+        nodes = list(self._nodes.values())
+        tasks = [
+            asyncio.create_task(self._run_node(node, live=(i == 0)))
+            for i, node in enumerate(nodes)
+        ]
+        results = {}
+        try:
+            for node, task in zip(nodes, tasks):
+                results[node.name] = await task
+                for entry in node.buffer:
+                    self.engine._write_log(*entry)
+                node.committed.set()
+        finally:
+            for task in tasks:
+                task.cancel()
+        return results
 
 
 class GameEngine:
-    def __init__(self):
-        self.llm = LLMInterface(CONFIG["api_key"])
-        self.players = self._setup_players()
-        self.shared_history = ["--- GAME START ---"]
+    def __init__(self, players: Optional[List[Player]] = None, headless: bool = False, request_limiter=None, event_log_path: Optional[str] = None, recorded: Sequence[GameEvent] = (), seed: Optional[int] = None):
+        self.telemetry = Telemetry(CONFIG["telemetry"]["enabled"], CONFIG["routing"]["prices"])
+        self.llm = LLMInterface(make_backend(), CONFIG["max_concurrent_requests"], make_response_cache(), request_limiter, self.telemetry)
+        self.seed = self._game_seed(seed)
+        self.rng = random.Random(self.seed)
+        self.roster = Roster(players if players is not None else self._setup_players())
+        self.players = self.roster.players
+        self.names = NameIndex([*self.roster.by_name, "Skip"], CONFIG["name_aliases"])
+        self.headless = headless
+        self.shared_history = GameHistory(["--- GAME START ---"])
+        self.mafia_chat = GameHistory()
+        for p in self.players:
+            if p.role == "Mafia":
+                p.subscribe(self.mafia_chat)
+        self.context_budget = ContextBudget(self.llm, self.shared_history, CONFIG["context_budget"], self.roster)
         self.day_count = 0
         self.is_game_over = False
+        self.winner: Optional[str] = None
+        self.eliminations: List[Dict[str, Any]] = []
+        self.action_retries: Counter = Counter()
+        self.speculation: Counter = Counter()
+        self.period = ""
+
+        # Event sourcing. Recorded decisions are queued per (kind, day, period,
+        # actor) so concurrent actors replay correctly whatever order they
+        # originally finished in; derived events are only checked, not rewritten.
+        if event_log_path is None and CONFIG["event_log"]["enabled"]:
+            event_log_path = os.path.join(CONFIG["event_log"]["dir"], time.strftime(f"game-%Y%m%d-%H%M%S-{os.getpid()}.jsonl"))
+        self.event_log = EventLog(event_log_path) if event_log_path else None
+        self._recorded: Dict[tuple, deque] = defaultdict(deque)
+        self._logged: Dict[tuple, GameEvent] = {}
+        for event in recorded:
+            if event.kind in DECISION_EVENTS:
+                self._recorded[event.key].append(event)
+            else:
+                self._logged[event.key] = event
+        self._pending_replay = sum(len(queue) for queue in self._recorded.values())
+        self.replaying = self._pending_replay > 0
+
+    @classmethod
+    def resume(cls, path: str, headless: bool = False, request_limiter=None) -> "GameEngine":
+        """Rebuilds a game from its event log; play() then continues where the log ends."""
+        events = EventLog.read(path)
+        if not events or events[0].kind != "game_start":
+            raise EventLogError(f"{path} does not start with a game_start event")
+        players = [Player(name, role, model) for name, role, model in events[0].data["roster"]]
+        return cls(players, headless, request_limiter, event_log_path=path, recorded=events)
+
+    def _game_seed(self, seed: Optional[int]) -> int:
+        """The seed for this game's chance draws.
+
+        Replay restores the seed the cache was recorded with. Otherwise it is
+        the argument, then CONFIG["seed"], then a read-through cache's stored
+        seed, then a fresh one.
+        """
+        cache = self.llm.response_cache
+        stored = cache.get_meta("seed") if cache and cache.mode != "record" else None
+        if stored is not None and cache.mode == "replay":
+            return int(stored)
+        if seed is None:
+            seed = CONFIG["seed"]
+        if seed is None and stored is not None:
+            seed = int(stored)
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+        if cache and cache.mode != "replay":
+            cache.set_meta("seed", str(seed))
+        return seed
+
+    def _replay(self, kind: str, actor: Optional[Player] = None) -> Optional[GameEvent]:
+        """The recorded decision for this actor and moment, if the log has one."""
+        if not self.replaying:
+            return None
+        queue = self._recorded.get((kind, self.day_count, self.period, actor.name if actor else None))
+        if not queue:
+            return None
+        event = queue.popleft()
+        self._pending_replay -= 1
+        if self._pending_replay == 0:
+            self.replaying = False
+            if not self.headless:
+                print(f"⏩ Replayed the event log; continuing live at {self.period} {self.day_count}.")
+        return event
+
+    def _record(self, kind: str, actor: Optional[Player] = None, target: Optional[str] = None, text: Optional[str] = None, data: Optional[Dict[str, Any]] = None):
+        """Appends an event, unless it is a derived event the log already holds."""
+        event = GameEvent(kind, self.day_count, self.period, actor.name if actor else None, target, text, data)
+        logged = self._logged.pop(event.key, None)
+        if logged is not None:
+            if logged.data != event.data or logged.target != event.target:
+                raise EventLogError(f"Replay diverged from the event log at {kind} ({self.period} {self.day_count}): expected {logged.to_json()}, got {event.to_json()}")
+            return
+        if self.event_log:
+            self.event_log.append(event)
+
+    def _snapshot(self):
+        self._record("snapshot", data={
+            "alive": self.roster.alive_names(),
+            "eliminations": len(self.eliminations),
+        })
 
     def _setup_players(self) -> List[Player]:
-        return [
-            Player("Madison", "Mafia", CONFIG["models"]["mafia"]),
-            Player("Avery", "Mafia", CONFIG["models"]["mafia"]),
-            Player("Anna", "Mafia", CONFIG["models"]["mafia"]),
-            Player("Maddie", "Doctor", CONFIG["models"]["doctor"]),
-            Player("Valentina", "Detective", CONFIG["models"]["detective"]),
-            Player("Amber", "Town", CONFIG["models"]["town"]),
-            Player("Elena", "Town", CONFIG["models"]["town"]),
-            Player("Ariana", "Town", CONFIG["models"]["town"]),
-            Player("Sava", "Town", CONFIG["models"]["town"]),
-            Player("Summer", "Town", CONFIG["models"]["town"]),
-            Player("Natalie", "Town", CONFIG["models"]["town"]),
-        ]
+        lobby = CONFIG["lobby"]
+        seats = generate_roster(lobby["size"], lobby, random.Random(lobby["seed"])) if lobby["size"] else DEFAULT_ROSTER
+        return [Player(name, role, CONFIG["models"][role.lower()]) for name, role in seats]
 
     def _strip_ansi(self, text: str) -> str:
         """Removes ANSI escape codes from a string for clean history logging."""
-        ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
-        return ansi_escape.sub('', text)
+        return ANSI_ESCAPE.sub('', text)
 
     def log(self, message: str, to_console: bool = True, to_shared_history: bool = True):
         """Adds to internal history (clean) and prints to CLI (colored)."""
+        buffer = _LOG_BUFFER.get()
+        if buffer is not None:
+            buffer.append((message, to_console, to_shared_history))
+            return
+        self._write_log(message, to_console, to_shared_history)
+
+    def _write_log(self, message: str, to_console: bool, to_shared_history: bool):
         if to_shared_history:
             self.shared_history.append(self._strip_ansi(message))
-        if to_console:
+        if to_console and not self.headless and not self.replaying:
             print(f"{message}")
 
     def get_player_by_name(self, name: str) -> Optional[Player]:
-        name = name.lower().strip()
-        name = name.replace('.', '').replace('!', '')
-        for p in self.players:
-            if p.name.lower() in name:
-                return p
-        return None
+        match = self.names.resolve(name, self.roster.by_name)
+        return self.roster.by_name.get(match)
 
-    def _get_valid_action_response(self, actor: Player, prompt: str, candidates: List[str]) -> Union[Player, str, None]:
+    def _action_prompt(self, prompt: str, candidates: List[str], invalid_response: Optional[str] = None) -> str:
         candidate_str = ", ".join(candidates)
         base_prompt = f"{prompt} Valid targets are: [{candidate_str}]."
-        current_prompt = base_prompt
-        
-        while True:
-            response = self.llm.generate(actor, "\n".join(self.shared_history), current_prompt, distinct_action=True, all_players=self.players)
-            if "Skip" in candidates and response.lower() == "skip":
-                return "Skip"
-            target = self.get_player_by_name(response)
-            
-            if target and target.name in candidates:
-                return target
-            
-            print(f"      [!] Retrying {actor.colored_name} due to invalid output: '{response}'")
-            current_prompt = (
-                f"{base_prompt}\n\n"
-                f"SYSTEM ERROR: You replied '{response}', which is NOT a valid target. "
-                f"Please output ONLY a name from this exact list: [{candidate_str}]."
-            )
-
-    def _get_inner_thoughts(self, actor: Player, prompt: str):
-        response = self.llm.generate(
-            actor, 
-            "\n".join(self.shared_history), 
-            f"{prompt} Keep it brief (1 sentence). NONE OF THE PLAYERS will see your response to this message, so answer in accordance to your true intentions and your role.",
-            all_players=self.players
+        if invalid_response is None:
+            return base_prompt
+        return (
+            f"{base_prompt}\n\n"
+            f"SYSTEM ERROR: You replied '{invalid_response}', which is NOT a valid target. "
+            f"Please output ONLY a name from this exact list: [{candidate_str}]."
         )
+
+    def _match_action(self, response: str, candidates: List[str]) -> Union[Player, str, None]:
+        """Maps a raw action reply onto a candidate, or None if it is not valid."""
+        match = self.names.resolve(response, candidates)
+        if match == "Skip":
+            return "Skip"
+        return self.roster.by_name.get(match)
+
+    async def _generate(self, player: Player, instruction: str, context: Union[str, HistorySnapshot, None] = None, distinct_action: bool = False, candidates: Optional[List[str]] = None, call_class: str = "statement", stream: Optional[LiveLine] = None, invalid_attempts: int = 0) -> str:
+        """Sends one call for `player`, fitted to the context budget. `context` defaults to the current public history.
+
+        After `escalate_after_invalid` unusable replies, a routed action goes to the player's own model.
+        """
+        history, memory = await self.context_budget.fit(player, instruction, context, distinct_action)
+        escalate = invalid_attempts >= CONFIG["routing"]["escalate_after_invalid"]
+        return await self.llm.generate(player, history, instruction, distinct_action=distinct_action, all_players=self.players, candidates=candidates, memory=memory, call_class=call_class, stream=stream, escalate=escalate, public_history=not isinstance(context, str))
+
+    async def _say(self, player: Player, header: str, instruction: str, context: Union[str, HistorySnapshot, None] = None, call_class: str = "statement", to_shared_history: bool = True) -> str:
+        """Generates a free-text reply and logs it after `header`.
+
+        When the log is going straight to the console the reply is streamed
+        as it arrives; either way only the final text reaches the history.
+        """
+        recorded = self._replay(call_class, player)
+        if recorded is not None:
+            text = recorded.text or ""  # logs written before empty replies were kept
+            self.log(f"{header}{text}", to_shared_history=to_shared_history)
+            return text
+
+        live = CONFIG["streaming"] and not self.headless and not self.replaying and _LOG_BUFFER.get() is None
+        line = LiveLine(header) if live else None
+        response = await self._generate(player, instruction, context, call_class=call_class, stream=line)
+        self._record(call_class, player, text=response)
+        if line and line.started:
+            line.close()
+            self.log(f"{header}{response}", to_console=False, to_shared_history=to_shared_history)
+        else:
+            self.log(f"{header}{response}", to_shared_history=to_shared_history)
+        return response
+
+    def _traced(self, kind: str, name: str, action: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        """Wraps an async action so it runs inside a telemetry span."""
+        async def run(*args):
+            with self.telemetry.span(kind, name):
+                return await action(*args)
+        return run
+
+    async def _get_valid_action_response(self, actor: Player, prompt: str, candidates: List[str], action: str) -> Union[Player, str, None]:
+        recorded = self._replay(action, actor)
+        if recorded is not None:
+            return self._match_action(recorded.target, candidates)
+
+        invalid_response = None
+        invalid_attempts = 0
+        with self.telemetry.span("actor", actor.name, role=actor.role, action=action):
+            while True:
+                response = await self._generate(actor, self._action_prompt(prompt, candidates, invalid_response), distinct_action=True, candidates=candidates, call_class="action", invalid_attempts=invalid_attempts)
+                choice = self._match_action(response, candidates)
+                if choice:
+                    self._record(action, actor, target=choice if choice == "Skip" else choice.name, data={"model": self.llm.answered_by.get(actor.name)})
+                    return choice
+                
+                self.action_retries[action] += 1
+                invalid_attempts += 1
+                if invalid_attempts > CONFIG["max_invalid_replies"]:
+                    raise LLMCallError(f"{actor.name} gave {invalid_attempts} unusable replies for {action}; last: {response!r}")
+                self.log(f"      [!] Retrying {actor.colored_name} due to invalid output: '{response}'", to_shared_history=False)
+                invalid_response = response
+
+    async def _get_inner_thoughts(self, actor: Player, prompt: str, context: Optional[HistorySnapshot] = None):
+        with self.telemetry.span("actor", actor.name, role=actor.role, action="thought"):
+            response = await self._say(
+                actor,
+                f"  💭 [{actor.colored_name} thinking]: ",
+                f"{prompt} Keep it brief (1 sentence). NONE OF THE PLAYERS will see your response to this message, so answer in accordance to your true intentions and your role.",
+                context,
+                call_class="thought",
+                to_shared_history=False
+            )
         actor.private_memory.append(f"Thought (Day {self.day_count}): {response}")
-        self.log(f"  💭 [{actor.colored_name} thinking]: {response}", to_console=True, to_shared_history=False)
 
     # --- NIGHT PHASE HELPERS ---
 
-    def _night_mafia_phase(self, alive_players, alive_names) -> Optional[Player]:
-        alive_mafia = [p for p in alive_players if p.role == "Mafia"]
+    async def _night_mafia_phase(self, alive_names: List[str]) -> Optional[Player]:
+        alive_mafia = self.roster.alive_with_role("Mafia")
         if not alive_mafia:
             return None
 
@@ -255,54 +2108,57 @@ class GameEngine:
             conspirators = ', '.join(p.colored_name for p in alive_mafia)
             self.log(f"\n  🌑 The Mafia ({conspirators}) are conspiring...", to_shared_history=False)
             mafia_chat_history = []
+            chatting = self._pick_speakers(alive_mafia)
             
             for round_num in range(CONFIG["mafia_discussion_rounds_per_night"]):
-                for m_player in alive_mafia:
+                for m_player in chatting:
                     chat_context = "\n".join(mafia_chat_history[-4:]) 
-                    statement = self.llm.generate(
-                        m_player,
-                        f"Night {self.day_count} Mafia Chat:\n{chat_context}",
-                        "Discuss with your fellow Mafia members who to kill tonight. Be strategic. Keep it brief (1 sentence).",
-                        all_players=self.players
-                    )
+                    with self.telemetry.span("actor", m_player.name, role=m_player.role, action="mafia_chat"):
+                        statement = await self._say(
+                            m_player,
+                            f"    💬 [{m_player.colored_name}]: ",
+                            "Discuss with your fellow Mafia members who to kill tonight. Be strategic. Keep it brief (1 sentence).",
+                            f"Night {self.day_count} Mafia Chat:\n{chat_context}",
+                            call_class="mafia_chat",
+                            to_shared_history=False
+                        )
                     
                     msg = f"Night {self.day_count} - {m_player.name} (Mafia Chat): {statement}"
                     mafia_chat_history.append(msg)
-                    self.log(f"    💬 [{m_player.colored_name}]: {statement}", to_shared_history=False)
                     
-                    for obs in alive_mafia:
-                        obs.private_memory.append(msg)
+                    self.mafia_chat.append(msg)
 
-            mafia_killer = random.choice(alive_mafia)
+            recorded = self._replay("killer", alive_mafia[0])
+            mafia_killer = self.get_player_by_name(recorded.target) if recorded else self.rng.choice(alive_mafia)
+            if not recorded:
+                self._record("killer", alive_mafia[0], target=mafia_killer.name)
             self.log(f"  🔪 {mafia_killer.colored_name} steps forward to perform the hit.", to_shared_history=False)
         else:
             mafia_killer = alive_mafia[0]
             self.log(f"\n  🌑 {mafia_killer.colored_name} is choosing a target...", to_shared_history=False)
-            self._get_inner_thoughts(mafia_killer, "Who is the biggest threat to you right now?")
+            await self._get_inner_thoughts(mafia_killer, "Who is the biggest threat to you right now?")
 
-        target_kill = self._get_valid_action_response(
+        target_kill = await self._get_valid_action_response(
             mafia_killer, 
             "Who do you want to KILL tonight?", 
-            [n for n in alive_names if n != mafia_killer.name]
+            [n for n in alive_names if n != mafia_killer.name],
+            "kill"
         )
         if target_kill:
             self.log(f"  🎯 The Mafia has targeted {target_kill.colored_name}.", to_shared_history=False)
             
         return target_kill
 
-    def _night_doctor_phase(self, alive_players, alive_names):
-        doctor = next((p for p in alive_players if p.role == "Doctor"), None)
-        if not doctor:
-            return
-
+    async def _night_doctor_phase(self, doctor: Player, alive_names: List[str]):
         self.log(f"\n  ⚕️  {doctor.colored_name} is choosing a patient...", to_shared_history=False)
         valid_saves = [n for n in alive_names if n != doctor.last_protected_target]
         
-        self._get_inner_thoughts(doctor, "Who will you save tonight and why?")
-        target_save = self._get_valid_action_response(
+        await self._get_inner_thoughts(doctor, "Who will you save tonight and why?")
+        target_save = await self._get_valid_action_response(
             doctor, 
             "Who do you want to SAVE tonight?", 
-            valid_saves
+            valid_saves,
+            "save"
         )
         
         if target_save and isinstance(target_save, Player):
@@ -310,144 +2166,368 @@ class GameEngine:
             self.log(f"  🛡️  The Doctor is protecting {target_save.colored_name}.", to_shared_history=False)
             doctor.last_protected_target = target_save.name
 
-    def _night_detective_phase(self, alive_players, alive_names):
-        detective = next((p for p in alive_players if p.role == "Detective"), None)
-        if not detective:
-            return
-
+    async def _night_detective_phase(self, detective: Player, alive_names: List[str]):
         self.log(f"\n  🔎 {detective.colored_name} is investigating a suspect...", to_shared_history=False)
-        self._get_inner_thoughts(detective, "Who will you investigate tonight and why?")
+        await self._get_inner_thoughts(detective, "Who will you investigate tonight and why?")
         
-        target_investigate = self._get_valid_action_response(
+        target_investigate = await self._get_valid_action_response(
             detective, 
             "Who do you want to INVESTIGATE?", 
-            [n for n in alive_names if n != detective.name]
+            [n for n in alive_names if n != detective.name],
+            "investigate"
         )
         
         if target_investigate and isinstance(target_investigate, Player):
             result = "Mafia" if target_investigate.role == "Mafia" else "Innocent"
             directive = f"Do everything you can to eliminate {target_investigate.name}" if target_investigate.role == 'Mafia' else "Remember that this person is innocent."
             note = f"Night {self.day_count}: Investigated {target_investigate.name}. Result: {result}. {directive}"
-            detective.private_memory.append(note)
+            detective.private_memory.append(note, pinned=True)
             self.log(f"  🔍 (Detective discovered that {target_investigate.colored_name} is {result})", to_shared_history=False)
 
     # --- PHASES ---
 
-    def run_night_phase(self):
+    async def run_night_phase(self):
         self.day_count += 1
+        self.period = "night"
+        await self.llm.start_day(self.day_count)
+        self.context_budget.start_day(self.day_count)
+        self._snapshot()
         self.log(f"\n{'='*40}\n🌙  NIGHT {self.day_count}\n{'='*40}")
 
-        for p in self.players:
+        for p in self.roster.alive():
             p.is_protected = False
 
-        alive_players = [p for p in self.players if p.is_alive]
-        alive_names = [p.name for p in alive_players]
+        with self.telemetry.span("night", f"night {self.day_count}"):
+            alive_names = self.roster.alive_names()
 
-        target_kill = self._night_mafia_phase(alive_players, alive_names)
-        self._night_doctor_phase(alive_players, alive_names)
-        self._night_detective_phase(alive_players, alive_names)
+            # The night roles act independently of each other. Large lobbies
+            # can have several Doctors and Detectives; each acts on their own.
+            night = PhaseScheduler(self).add("mafia", self._traced("phase", "mafia", self._night_mafia_phase), alive_names)
+            for doctor in self.roster.alive_with_role("Doctor"):
+                night.add(f"doctor:{doctor.name}", self._traced("phase", "doctor", self._night_doctor_phase), doctor, alive_names)
+            for detective in self.roster.alive_with_role("Detective"):
+                night.add(f"detective:{detective.name}", self._traced("phase", "detective", self._night_detective_phase), detective, alive_names)
+            target_kill = (await night.run())["mafia"]
 
-        self.log(f"\n{'-'*40}\n🌅  MORNING REPORT\n{'-'*40}")
-        if target_kill and isinstance(target_kill, Player):
-            if target_kill.is_protected:
-                self.log(f"  🩸 Mafia attacked {target_kill.colored_name}, but they were saved by the Doctor!")
+            self.log(f"\n{'-'*40}\n🌅  MORNING REPORT\n{'-'*40}")
+            if target_kill and isinstance(target_kill, Player):
+                if target_kill.is_protected:
+                    self.log(f"  🩸 Mafia attacked {target_kill.colored_name}, but they were saved by the Doctor!")
+                else:
+                    self._eliminate(target_kill, "killed")
+                    self.log(f"  🪦 {target_kill.colored_name} was found dead this morning.")
             else:
-                target_kill.is_alive = False
-                self.log(f"  🪦 {target_kill.colored_name} was found dead this morning.")
-        else:
-            self.log("  🕊️ The night was quiet. No one died.")
+                self.log("  🕊️ The night was quiet. No one died.")
 
-    def run_day_phase(self):
+    async def run_day_phase(self):
+        self.period = "day"
+        self._snapshot()
         self.log(f"\n{'='*40}\n☀️  DAY {self.day_count}\n{'='*40}")
         
         if self.check_win_condition(): return
 
-        alive = [p for p in self.players if p.is_alive]
-        
-        # 1. Discussion Rounds
-        for round_num in range(CONFIG["discussion_rounds_per_day"]):
-            self.log(f"\n  {'-'*10} Discussion Round {round_num + 1} {'-'*10}\n")
-            for player in alive:
-                statement = self.llm.generate(
-                    player, 
-                    "\n".join(self.shared_history), 
-                    "Discuss the recent events and who you suspect. Keep it under 2 sentences. YOUR RESPONSE HERE WILL NOT BE A PRIVATE MESSAGE TO OTHER MAFIA. EVERY PLAYER WILL SEE YOUR RESPONSE TO THIS ONE. DO NOT ADD ANY SELF-INCRIMINATING COMMENTS OR THOUGHTS TO YOUR RESPONSE. Detective, reference your notes when deciding who to discuss/accuse for.",
-                    all_players=self.players
-                )
-                self.log(f"  🗣️ [{player.colored_name}]: {statement}")
-
-        # 2. Voting
-        self.log(f"\n  {'-'*10} VOTING PHASE {'-'*10}\n")
-        votes = {}
-        
-        for player in alive:
-            self._get_inner_thoughts(player, "Who do you want to vote for and why?")
-            
-            vote_target = self._get_valid_action_response(
-                player,
-                "Remember that your votes can be seen publicly. Detective, reference your notes when deciding who to vote for. Who do you vote to eliminate? Output player name or 'Skip'.",
-                [p.name for p in alive] + ['Skip']
-            )
-            
-            if vote_target == "Skip":
-                votes["Skip"] = votes.get("Skip", 0) + 1
-                self.log(f"  🤚 {player.colored_name} voted to Skip.")
-            elif vote_target:
-                votes[vote_target.name] = votes.get(vote_target.name, 0) + 1
-                self.log(f"  ⚖️ {player.colored_name} voted for {vote_target.colored_name}.")
-            else:
-                self.log(f"  🤚 {player.colored_name} abstained.")
+        with self.telemetry.span("day", f"day {self.day_count}"):
+            alive = self.roster.alive()
+
+            # 1. Discussion Rounds
+            with self.telemetry.span("phase", "discussion"):
+                nominated = await self._collect_nominations(alive) if CONFIG["discussion"]["mode"] == "nominations" else None
+                for round_num in range(CONFIG["discussion_rounds_per_day"]):
+                    self.log(f"\n  {'-'*10} Discussion Round {round_num + 1} {'-'*10}\n")
+                    speakers = nominated if nominated is not None else self._pick_speakers(alive)
+                    if CONFIG["discussion"]["speculative"]:
+                        await self._speculative_discussion(speakers)
+                        continue
+                    for player in speakers:
+                        with self.telemetry.span("actor", player.name, role=player.role, action="statement"):
+                            await self._say(player, f"  🗣️ [{player.colored_name}]: ", DISCUSS_PROMPT)
+
+            # 2. Voting
+            with self.telemetry.span("phase", "voting"):
+                self.log(f"\n  {'-'*10} VOTING PHASE {'-'*10}\n")
+                votes = {}
 
-        # 3. Resolve Vote
-        self.log(f"\n  {'-'*10} VOTE RESOLUTION {'-'*10}\n")
-        if votes:
-            max_votes = max(votes.values())
-            candidates = [name for name, count in votes.items() if count == max_votes]
+                if CONFIG["voting_mode"] == "sealed":
+                    ballots = await self._collect_sealed_ballots(alive)
+                    self.log(f"\n  {'-'*10} VOTE RESOLUTION {'-'*10}\n")
+                    self.log("  🗳️ The sealed ballots are opened:")
+                    for player in alive:
+                        self._record_vote(player, ballots[player.name], votes)
+                else:
+                    await self._collect_sequential_votes(alive, votes)
+                    self.log(f"\n  {'-'*10} VOTE RESOLUTION {'-'*10}\n")
+
+            # 3. Resolve Vote
+            if votes:
+                max_votes = max(votes.values())
+                candidates = [name for name, count in votes.items() if count == max_votes]
             
-            if len(candidates) == 1:
-                victim_name = candidates[0]
-                if victim_name == "Skip":
-                    self.log("  🏳️ The town voted to Skip. No one was executed.")
+                if len(candidates) == 1:
+                    victim_name = candidates[0]
+                    if victim_name == "Skip":
+                        self.log("  🏳️ The town voted to Skip. No one was executed.")
+                    else:
+                        victim = self.get_player_by_name(victim_name)
+                        if victim:
+                            self._eliminate(victim, "executed")
+                            self.log(f"  🪓 The town has decided. {victim.colored_name} is executed.\n  🎭 Their role was: {victim.role}")
                 else:
-                    victim = self.get_player_by_name(victim_name)
-                    if victim:
-                        victim.is_alive = False
-                        self.log(f"  🪓 The town has decided. {victim.colored_name} is executed.\n  🎭 Their role was: {victim.role}")
+                    self.log("  ⚖️ The vote was tied. No one was executed.")
             else:
-                self.log("  ⚖️ The vote was tied. No one was executed.")
+                self.log("  ⚖️ No votes were cast.")
+
+    def _pick_speakers(self, players: List[Player]) -> List[Player]:
+        """Caps who speaks at max_speakers, keeping seat order (unless the mode is "all").
+
+        The draw is chance, so it is recorded and replayed like a decision.
+        """
+        settings = CONFIG["discussion"]
+        if settings["mode"] == "all" or len(players) <= settings["max_speakers"]:
+            return players
+        recorded = self._replay("speakers")
+        if recorded is not None:
+            chosen = set(recorded.data["names"])
+        else:
+            chosen = {p.name for p in self.rng.sample(players, settings["max_speakers"])}
+            self._record("speakers", data={"names": [p.name for p in players if p.name in chosen]})
+        return [p for p in players if p.name in chosen]
+
+    async def _collect_nominations(self, alive: List[Player]) -> List[Player]:
+        """Everyone nominates a suspect at once; the leading nominees and one accuser each get the floor."""
+        self.log(f"\n  {'-'*10} NOMINATIONS {'-'*10}\n")
+        names = [p.name for p in alive]
+        nominations = PhaseScheduler(self)
+        for player in alive:
+            nominations.add(player.name, self._get_valid_action_response, player, NOMINATE_PROMPT, [n for n in names if n != player.name], "nominate")
+        nominees = await nominations.run()
+
+        tally = Counter(nominee.name for nominee in nominees.values())
+        leaders = [name for name, _ in tally.most_common(max(1, CONFIG["discussion"]["max_speakers"] // 2))]
+        self.log("  📌 Nominated: " + ", ".join(f"{self.roster.by_name[name].colored_name} ({tally[name]})" for name in leaders))
+
+        speakers = []
+        for name in leaders:
+            accuser = next(voter for voter, nominee in nominees.items() if nominee.name == name)
+            speakers += [accuser, name]
+        return [self.roster.by_name[name] for name in dict.fromkeys(speakers)]
+
+    async def _speculative_discussion(self, speakers: List[Player]):
+        """One discussion round with each statement drafted while the previous one is in flight.
+
+        A draft is written against the history without the statement before
+        it, so it is kept only if that statement does not name its speaker;
+        otherwise it is discarded and the turn regenerated. Statements are
+        still logged strictly in seat order.
+        """
+        async def draft(player: Player, snapshot: HistorySnapshot) -> Tuple[str, float, float]:
+            with self.telemetry.span("actor", player.name, role=player.role, action="draft"):
+                started = time.perf_counter()
+                text = await self._generate(player, DISCUSS_PROMPT, snapshot)
+                return text, started, time.perf_counter()
+
+        pending: Optional[asyncio.Task] = None
+        previous = ""
+        try:
+            for index, player in enumerate(speakers):
+                drafted, pending = pending, None
+                if index + 1 < len(speakers) and not self.replaying:
+                    # The task may not start until after this turn's statement is
+                    # logged, so pin the history the draft is written against now.
+                    pending = asyncio.create_task(draft(speakers[index + 1], self.shared_history.snapshot()))
+                header = f"  🗣️ [{player.colored_name}]: "
+                with self.telemetry.span("actor", player.name, role=player.role, action="statement"):
+                    if drafted is not None and player.name in self.names.mentions(previous):
+                        await self._discard(drafted)
+                        drafted = None
+                        self.speculation["rejected"] += 1
+                    if drafted is None:
+                        previous = await self._say(player, header, DISCUSS_PROMPT)
+                        continue
+                    waiting_since = time.perf_counter()
+                    previous, started, finished = await drafted
+                    self.speculation["accepted"] += 1
+                    self.speculation["seconds_saved"] += max(0.0, (finished - started) - (time.perf_counter() - waiting_since))
+                    self._record("statement", player, text=previous)
+                    self.log(f"{header}{previous}")
+        finally:
+            if pending is not None:
+                await self._discard(pending)
+
+    @staticmethod
+    async def _discard(task: asyncio.Task):
+        """Cancels a draft and waits for it to unwind out of any shared awaits (summaries, limiter, cache)."""
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError, Exception):
+            await task
+
+    async def _collect_sequential_votes(self, alive: List[Player], votes: Dict[str, int]):
+        # Strictly serial: each voter thinks only after every earlier vote is
+        # public, exactly as at a real table. Use "sealed" voting for a
+        # concurrent ballot.
+        for player in alive:
+            await self._get_inner_thoughts(player, "Who do you want to vote for and why?")
+            await self._cast_vote(player, alive, votes)
+
+    async def _collect_sealed_ballots(self, alive: List[Player]) -> Dict[str, Union[Player, str]]:
+        """Collects every vote in parallel against one history snapshot.
+
+        Nothing is logged publicly until the caller reveals the ballots, so the
+        public history stays fixed throughout and no voter is anchored by
+        another. Invalid replies are re-dispatched in batches containing only
+        the voters that failed.
+        """
+        candidates = [p.name for p in alive] + ['Skip']
+        snapshot = self.shared_history.snapshot()
+
+        # First round: each voter thinks and then votes, all voters at once.
+        first_round = PhaseScheduler(self)
+        replayed = set()
+        for player in alive:
+            first_round.add(player.name, self._sealed_ballot, player, candidates, replayed, snapshot)
+        responses = await first_round.run()
+
+        ballots = {}
+        invalid = {}
+        invalid_attempts = Counter()
+        pending = list(alive)
+        while pending:
+            retry = []
+            for player in pending:
+                response = responses[player.name]
+                choice = self._match_action(response, candidates)
+                if choice:
+                    ballots[player.name] = choice
+                    if player.name not in replayed:
+                        self._record("vote", player, target=choice if choice == "Skip" else choice.name, data={"model": self.llm.answered_by.get(player.name)})
+                else:
+                    self.action_retries["vote"] += 1
+                    invalid_attempts[player.name] += 1
+                    if invalid_attempts[player.name] > CONFIG["max_invalid_replies"]:
+                        raise LLMCallError(f"{player.name} gave {invalid_attempts[player.name]} unusable replies for vote; last: {response!r}")
+                    self.log(f"      [!] Retrying {player.colored_name} due to invalid output: '{response}'", to_shared_history=False)
+                    invalid[player.name] = response
+                    retry.append(player)
+            if retry:
+                retried = await asyncio.gather(*(
+                    self._generate(player, self._action_prompt(VOTE_PROMPT, candidates, invalid[player.name]), snapshot, distinct_action=True, candidates=candidates, call_class="action", invalid_attempts=invalid_attempts[player.name])
+                    for player in retry
+                ))
+                responses.update(zip((p.name for p in retry), retried))
+            pending = retry
+        return ballots
+
+    async def _sealed_ballot(self, player: Player, candidates: List[str], replayed: set, snapshot: HistorySnapshot) -> str:
+        await self._get_inner_thoughts(player, "Who do you want to vote for and why?", snapshot)
+        recorded = self._replay("vote", player)
+        if recorded is not None:
+            replayed.add(player.name)
+            return recorded.target
+        return await self._generate(player, self._action_prompt(VOTE_PROMPT, candidates), snapshot, distinct_action=True, candidates=candidates, call_class="action")
+
+    async def _cast_vote(self, player: Player, alive: List[Player], votes: Dict[str, int]):
+        vote_target = await self._get_valid_action_response(
+            player,
+            VOTE_PROMPT,
+            [p.name for p in alive] + ['Skip'],
+            "vote"
+        )
+        self._record_vote(player, vote_target, votes)
+
+    def _record_vote(self, player: Player, vote_target: Union[Player, str, None], votes: Dict[str, int]):
+        if vote_target == "Skip":
+            votes["Skip"] = votes.get("Skip", 0) + 1
+            self.log(f"  🤚 {player.colored_name} voted to Skip.")
+        elif vote_target:
+            votes[vote_target.name] = votes.get(vote_target.name, 0) + 1
+            self.log(f"  ⚖️ {player.colored_name} voted for {vote_target.colored_name}.")
         else:
-            self.log("  ⚖️ No votes were cast.")
+            self.log(f"  🤚 {player.colored_name} abstained.")
+
+    def _eliminate(self, player: Player, cause: str):
+        self.roster.eliminate(player)
+        self.eliminations.append({"day": self.day_count, "name": player.name, "role": player.role, "cause": cause})
+        self._record("elimination", player, text=cause)
 
     def check_win_condition(self) -> bool:
-        mafia = [p for p in self.players if p.role == "Mafia" and p.is_alive]
-        innocent = [p for p in self.players if p.role != "Mafia" and p.is_alive]
+        winner = self.roster.winner()
 
-        if not mafia:
+        if winner == "Innocents":
             self.log(f"\n{'='*40}\n🏆 GAME OVER: The Innocents have won!\n{'='*40}")
             self.is_game_over = True
-            input(">")
+            self.winner = "Innocents"
+            self._record("game_over", target=self.winner)
+            if not self.headless:
+                input(">")
             return True
         
-        if len(mafia) >= len(innocent):
+        if winner == "Mafia":
             self.log(f"\n{'='*40}\n🏆 GAME OVER: The Mafia has taken over the town!\n{'='*40}")
             self.is_game_over = True
-            input(">")
+            self.winner = "Mafia"
+            self._record("game_over", target=self.winner)
+            if not self.headless:
+                input(">")
             return True
         
         return False
 
+    async def play(self):
+        if not self.headless:
+            print(f"\nStarting Mafia Simulation (seed {self.seed})...\n")
+        self.llm.executor.start_game()
+        self._record("game_start", data={"roster": [[p.name, p.role, p.model_id] for p in self.players]})
+        with self.telemetry.span("game", "game"):
+            while not self.is_game_over:
+                await self.run_night_phase()
+                if self.check_win_condition(): break
+                await self.run_day_phase()
+                if self.check_win_condition(): break
+
+        stats = self.llm.cache_stats
+        if stats is not None and not self.headless:
+            print(f"📦 Context cache: {stats['hits']} hits, {stats['misses']} misses")
+        if CONFIG["context_budget"]["enabled"] and not self.headless:
+            print(f"🗜️ Context budget: {self.context_budget.report()}")
+        if self.action_retries and not self.headless:
+            print(f"🔁 Invalid-target retries: {dict(self.action_retries)}")
+        if self.llm.executor.stats["escalations"] and not self.headless:
+            print(f"⏫ Timed-out calls moved to the player's model: {self.llm.executor.stats['escalations']}")
+        drafts = self.speculation["accepted"] + self.speculation["rejected"]
+        if drafts and not self.headless:
+            print(f"🔮 Speculative turns: {self.speculation['accepted']}/{drafts} drafts kept, ~{self.speculation['seconds_saved']:.1f}s of waiting saved")
+        cache = self.llm.response_cache
+        if cache:
+            if not self.headless:
+                print(f"💾 Response cache ({cache.mode}): {cache.hit_rate:.0%} hit rate, {cache.stats['bytes_saved'] / 1024:.1f} KiB saved")
+            cache.close()
+
+        if self.event_log:
+            self.event_log.close()
+            if not self.headless:
+                print(f"📜 Event log: {self.event_log.path}")
+
+        settings = CONFIG["telemetry"]
+        if self.telemetry.enabled:
+            if settings["print_summary"] and not self.headless:
+                print(f"📈 Telemetry:\n{self.telemetry.summary_table()}")
+            if settings["trace_path"]:
+                self.telemetry.write_trace(settings["trace_path"])
+            if settings["metrics_path"]:
+                with open(settings["metrics_path"], "w") as f:
+                    f.write(self.telemetry.prometheus_text())
+
     def start(self):
-        print("\nStarting Mafia Simulation...\n")
-        while not self.is_game_over:
-            self.run_night_phase()
-            if self.check_win_condition(): break
-            self.run_day_phase()
-            if self.check_win_condition(): break
+        asyncio.run(self.play())
 
 # --- EXECUTION ---
 if __name__ == "__main__":
-    if CONFIG["api_key"] == "YOUR_API_KEY_HERE":
+    parser = argparse.ArgumentParser(description="Run a Mafia game between LLM players.")
+    parser.add_argument("--resume", metavar="EVENT_LOG", help="Continue an interrupted game from its event log.")
+    parser.add_argument("--seed", type=int, default=CONFIG["seed"], help="Seed for the engine's chance draws (stored with response-cache recordings).")
+    args = parser.parse_args()
+
+    if CONFIG["backend"] == "genai" and CONFIG["api_key"] == "YOUR_API_KEY_HERE":
         print("❌ Please update the CONFIG dictionary with your API Key.")
     else:
-        game = GameEngine()
+        game = GameEngine.resume(args.resume) if args.resume else GameEngine(seed=args.seed)
         game.start()
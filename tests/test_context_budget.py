@@ -0,0 +1,54 @@
+import asyncio
+
+from mafia import CONFIG, ContextBudget, GameHistory, LLMInterface, MockBackend, Player, Roster
+
+
+def make_budget(latency_seconds=0.05):
+    players = [Player("Avery", "Town", "mock"), Player("Madison", "Mafia", "mock")]
+    history = GameHistory(["--- GAME START ---"])
+    llm = LLMInterface(MockBackend(latency_seconds=latency_seconds))
+    settings = {**CONFIG["context_budget"], "enabled": True, "max_prompt_tokens": 1600, "keep_recent_days": 1, "summary_model": "mock"}
+    budget = ContextBudget(llm, history, settings, Roster(players))
+    for day in (1, 2):
+        budget.start_day(day)
+        for i in range(40):
+            history.append(f"Day {day}: Madison said something long and suspicious about Avery, line {i}.")
+    return budget, players[0]
+
+
+def test_cancelled_caller_does_not_poison_the_shared_summary():
+    async def run():
+        budget, player = make_budget()
+        first = asyncio.ensure_future(budget.fit(player, "Discuss."))
+        await asyncio.sleep(0.01)  # first caller is now waiting on the Day 1 summary
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        history, _ = await budget.fit(player, "Discuss.")
+        return history
+
+    assert "[Summary of Day 1]" in asyncio.run(run())
+
+
+def test_failed_summary_is_retried():
+    async def run():
+        budget, player = make_budget(latency_seconds=0.0)
+        complete = budget.llm.complete
+        calls = []
+
+        async def flaky(model, text):
+            calls.append(model)
+            if len(calls) == 1:
+                raise RuntimeError("summary failed")
+            return await complete(model, text)
+
+        budget.llm.complete = flaky
+        try:
+            await budget.fit(player, "Discuss.")
+        except RuntimeError:
+            pass
+        history, _ = await budget.fit(player, "Discuss.")
+        return history, len(calls)
+
+    history, calls = asyncio.run(run())
+    assert "[Summary of Day 1]" in history
+    assert calls == 2
@@ -0,0 +1,31 @@
+import random
+
+import pytest
+
+import mafia
+from mafia import CONFIG, GameEngine, LLMCallError
+
+
+@pytest.fixture
+def offline(monkeypatch):
+    monkeypatch.setitem(CONFIG, "backend", "mock")
+    monkeypatch.setitem(CONFIG, "retry", {**CONFIG["retry"], "base_delay_seconds": 0})
+    monkeypatch.setitem(CONFIG, "event_log", {**CONFIG["event_log"], "enabled": False})
+    monkeypatch.setitem(CONFIG, "response_cache", {**CONFIG["response_cache"], "mode": "off"})
+    random.seed(0)
+
+
+def test_backend_that_only_returns_garbage_ends_the_game(offline, monkeypatch):
+    monkeypatch.setitem(CONFIG, "mock", {**CONFIG["mock"], "invalid_rate": 1.0, "error_rate": 0.0})
+    with pytest.raises(LLMCallError, match="unusable replies"):
+        GameEngine(headless=True).start()
+
+
+def test_missing_genai_client_fails_instead_of_replying(offline, monkeypatch):
+    def broken_client(api_key):
+        raise ValueError("no key")
+
+    monkeypatch.setitem(CONFIG, "backend", "genai")
+    monkeypatch.setattr(mafia.genai, "Client", broken_client)
+    with pytest.raises(LLMCallError, match="No GenAI client"):
+        GameEngine(headless=True).start()
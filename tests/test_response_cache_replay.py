@@ -0,0 +1,24 @@
+import random
+
+from mafia import CONFIG, GameEngine
+
+
+def play(monkeypatch, tmp_path, mode, seed=None):
+    monkeypatch.setitem(CONFIG, "backend", "mock")
+    monkeypatch.setitem(CONFIG, "mock", {**CONFIG["mock"], "seed": 1, "error_rate": 0.0, "invalid_rate": 0.0})
+    monkeypatch.setitem(CONFIG, "retry", {**CONFIG["retry"], "base_delay_seconds": 0})
+    monkeypatch.setitem(CONFIG, "event_log", {**CONFIG["event_log"], "enabled": False})
+    monkeypatch.setitem(CONFIG, "response_cache", {**CONFIG["response_cache"], "mode": mode, "path": str(tmp_path / "cache.sqlite3")})
+    engine = GameEngine(headless=True, seed=seed)
+    engine.start()
+    return engine
+
+
+def test_replay_restores_the_recorded_seed(monkeypatch, tmp_path):
+    recorded = play(monkeypatch, tmp_path, "record", seed=5)
+    random.seed(6)  # the global RNG must not matter
+    replayed = play(monkeypatch, tmp_path, "replay")
+
+    assert replayed.seed == 5
+    assert replayed.llm.api_calls == 0
+    assert replayed.shared_history.render() == recorded.shared_history.render()
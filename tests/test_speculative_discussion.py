@@ -0,0 +1,23 @@
+import random
+
+from mafia import CONFIG, GameEngine
+
+
+def test_rejected_drafts_across_day_boundaries(monkeypatch):
+    monkeypatch.setitem(CONFIG, "backend", "mock")
+    monkeypatch.setitem(CONFIG, "mock", {**CONFIG["mock"], "seed": 1, "latency_seconds": 0.002, "error_rate": 0.0, "invalid_rate": 0.0})
+    monkeypatch.setitem(CONFIG, "retry", {**CONFIG["retry"], "base_delay_seconds": 0})
+    monkeypatch.setitem(CONFIG, "event_log", {**CONFIG["event_log"], "enabled": False})
+    monkeypatch.setitem(CONFIG, "response_cache", {**CONFIG["response_cache"], "mode": "off"})
+    monkeypatch.setitem(CONFIG, "discussion", {**CONFIG["discussion"], "mode": "all", "speculative": True})
+    # Small enough that every day after the first needs the previous days' summaries.
+    monkeypatch.setitem(CONFIG, "context_budget", {**CONFIG["context_budget"], "enabled": True, "max_prompt_tokens": 1500, "keep_recent_days": 1})
+    random.seed(3)
+
+    engine = GameEngine(headless=True)
+    engine.start()
+
+    assert engine.winner is not None
+    assert engine.day_count >= 2
+    assert engine.speculation["rejected"] > 0
+    assert engine.context_budget.summaries
@@ -0,0 +1,190 @@
+"""Headless tournament runner.
+
+Plays many games across a process pool, varying the seed and the role and
+model assignments per game. Per-game results stream to a JSONL file as games
+finish, and win rates per model and role are summarized at the end.
+
+    python tournament.py --games 200 --workers 8 --out results.jsonl
+    python tournament.py --games 1000 --backend mock
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
+
+import mafia
+from mafia import CONFIG, DEFAULT_ROSTER, GameEngine, Player, generate_roster
+
+# Set in each worker by _init_worker.
+_request_limiter = None
+
+
+def make_game_spec(index: int, base_seed: int, model_pool: List[str], lobby_size: Optional[int] = None) -> Dict[str, Any]:
+    """Deals roles (to the default names, or a generated lobby) and a model to each role for one game."""
+    seed = base_seed + index
+    rng = random.Random(seed)
+    seats = generate_roster(lobby_size, CONFIG["lobby"], rng) if lobby_size else DEFAULT_ROSTER
+    names = [name for name, _ in seats]
+    roles = [role for _, role in seats]
+    rng.shuffle(roles)
+    models = {role: rng.choice(model_pool) for role in sorted(set(roles))}
+    return {
+        "game": index,
+        "seed": seed,
+        "roster": [(name, role, models[role]) for name, role in zip(names, roles)],
+    }
+
+
+def _init_worker(request_limiter, config_overrides: Dict[str, Any]):
+    global _request_limiter
+    _request_limiter = request_limiter
+    mafia.CONFIG.update(config_overrides)
+
+
+def play_game(spec: Dict[str, Any]) -> Dict[str, Any]:
+    """Plays one headless game and returns its result record."""
+    CONFIG["mock"] = {**CONFIG["mock"], "seed": spec["seed"]}
+    players = [Player(name, role, model) for name, role, model in spec["roster"]]
+    event_log_path = os.path.join(CONFIG["event_log"]["dir"], f"game-{spec['game']:05d}.jsonl") if CONFIG["event_log"]["enabled"] else None
+    engine = GameEngine(players, headless=True, request_limiter=_request_limiter, event_log_path=event_log_path, seed=spec["seed"])
+
+    started = time.perf_counter()
+    result = {"game": spec["game"], "seed": spec["seed"]}
+    try:
+        engine.start()
+    except Exception as e:
+        result["error"] = repr(e)
+
+    mafia_won = engine.winner == "Mafia"
+    result.update({
+        "winner": engine.winner,
+        "days": engine.day_count,
+        "eliminations": engine.eliminations,
+        "api_calls": engine.llm.api_calls,
+        "telemetry": engine.telemetry.totals(),
+        "action_retries": dict(engine.action_retries),
+        "speculation": dict(engine.speculation),
+        "seconds": round(time.perf_counter() - started, 3),
+        "players": [
+            {
+                "name": p.name,
+                "role": p.role,
+                "model": p.model_id,
+                "survived": p.is_alive,
+                "won": engine.winner is not None and (p.role == "Mafia") == mafia_won,
+            }
+            for p in players
+        ],
+    })
+    return result
+
+
+def wilson_interval(wins: float, total: int, z: float = 1.96) -> Tuple[float, float]:
+    """95% Wilson score interval for a win rate."""
+    if total == 0:
+        return 0.0, 0.0
+    p = wins / total
+    denom = 1 + z * z / total
+    centre = (p + z * z / (2 * total)) / denom
+    margin = z * math.sqrt(p * (1 - p) / total + z * z / (4 * total * total)) / denom
+    return max(0.0, centre - margin), min(1.0, centre + margin)
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """Win rates (with 95% CIs) per model, per role and per model/role pair.
+
+    Seats in one game share its outcome, so each game counts as one trial per
+    key, scored by the share of that key's seats that won (a model playing
+    both sides of a game wins half a trial). Counting seats instead would
+    overstate n and make the intervals too narrow.
+    """
+    tallies = {"model": defaultdict(lambda: [0.0, 0, 0]), "role": defaultdict(lambda: [0.0, 0, 0]), "model/role": defaultdict(lambda: [0.0, 0, 0])}
+    for result in results:
+        if result.get("winner") is None:
+            continue
+        seats = defaultdict(list)
+        for p in result["players"]:
+            for group, key in (("model", p["model"]), ("role", p["role"]), ("model/role", f"{p['model']} / {p['role']}")):
+                seats[group, key].append(p["won"])
+        for (group, key), won in seats.items():
+            tally = tallies[group][key]
+            tally[0] += sum(won) / len(won)
+            tally[1] += 1
+            tally[2] += len(won)
+
+    summary = {}
+    for group, counts in tallies.items():
+        summary[group] = {}
+        for key, (wins, games, seats) in sorted(counts.items()):
+            low, high = wilson_interval(wins, games)
+            summary[group][key] = {"wins": wins, "games": games, "seats": seats, "win_rate": wins / games, "ci95": [low, high]}
+    return summary
+
+
+def print_summary(results: List[Dict[str, Any]]):
+    finished = [r for r in results if r.get("winner")]
+    failed = len(results) - len(finished)
+    mafia_wins = sum(r["winner"] == "Mafia" for r in finished)
+    print(f"\n🏁 {len(finished)} games finished ({failed} failed). Mafia won {mafia_wins}, Innocents won {len(finished) - mafia_wins}.")
+    if finished:
+        print(f"   Avg days: {sum(r['days'] for r in finished) / len(finished):.1f}, avg API calls: {sum(r['api_calls'] for r in finished) / len(finished):.0f}")
+
+    for group, rows in summarize(results).items():
+        print(f"\n  Win rate by {group}:")
+        for key, row in rows.items():
+            low, high = row["ci95"]
+            print(f"    {key:<40} {row['win_rate']:6.1%}  [{low:.1%}, {high:.1%}]  (n={row['games']} games, {row['seats']} seats)")
+
+
+def run_tournament(games: int, workers: int, out_path: str, base_seed: int, model_pool: List[str], max_concurrent_requests: int, config_overrides: Dict[str, Any], lobby_size: Optional[int] = None) -> List[Dict[str, Any]]:
+    specs = [make_game_spec(i, base_seed, model_pool, lobby_size) for i in range(games)]
+    results = []
+    with multiprocessing.Manager() as manager:
+        limiter = manager.BoundedSemaphore(max_concurrent_requests)
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(limiter, config_overrides)) as pool, open(out_path, "a") as out:
+            futures = [pool.submit(play_game, spec) for spec in specs]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+                status = result.get("winner") or f"error: {result.get('error')}"
+                print(f"  game {result['game']:>4} (seed {result['seed']}): {status} after {result['days']} days, {result['api_calls']} calls")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run many headless Mafia games in parallel.")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--out", default="tournament_results.jsonl")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the first game; game i uses seed + i.")
+    parser.add_argument("--models", default=",".join(sorted(set(CONFIG["models"].values()))), help="Comma-separated pool of models to assign to roles.")
+    parser.add_argument("--backend", choices=["genai", "mock"], default=CONFIG["backend"])
+    parser.add_argument("--lobby-size", type=int, help="Generate lobbies of this many players instead of the default 11.")
+    parser.add_argument("--discussion", choices=["all", "sampled", "nominations"], default=CONFIG["discussion"]["mode"], help="Day discussion mode; large lobbies want sampled or nominations.")
+    parser.add_argument("--speculative", action="store_true", help="Draft each discussion turn while the previous one is in flight.")
+    parser.add_argument("--routing", action="store_true", help="Turn model routing on. Off by default so each seat's decisions come from its assigned model.")
+    parser.add_argument("--event-log-dir", help="Write one event log per game to this directory (off by default).")
+    parser.add_argument("--max-concurrent-requests", type=int, default=CONFIG["max_concurrent_requests"], help="Global limit on in-flight API calls across all workers.")
+    args = parser.parse_args()
+
+    overrides = {"backend": args.backend, "discussion": {**CONFIG["discussion"], "mode": args.discussion, "speculative": args.speculative or CONFIG["discussion"]["speculative"]}, "event_log": {"enabled": bool(args.event_log_dir), "dir": args.event_log_dir}, "routing": {**CONFIG["routing"], "enabled": args.routing}}
+    if args.backend == "mock":
+        overrides["retry"] = {**CONFIG["retry"], "base_delay_seconds": 0}
+    results = run_tournament(
+        args.games, args.workers, args.out, args.seed,
+        [m.strip() for m in args.models.split(",") if m.strip()],
+        args.max_concurrent_requests, overrides, args.lobby_size,
+    )
+    print_summary(results)
+
+
+if __name__ == "__main__":
+    main()